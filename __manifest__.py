@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Recipe & Food Costing',
-    'version': '18.0.4.1.0',
+    'version': '18.0.5.0.0',
     'category': 'Point of Sale',
     'summary': 'Restaurant recipe management with BOM/kit integration, stocktaking, and COGS tracking',
     'description': """
@@ -19,18 +19,33 @@ Recipe & Food Costing for Restaurants
     'author': 'Donialink, Yousif Shakir',
     'website': 'https://www.donialink.com',
     'depends': ['point_of_sale', 'mrp', 'stock_account', 'uom', 'mail'],
+    'external_dependencies': {
+        'python': ['numpy'],
+    },
     'data': [
         'security/ir.model.access.csv',
         'report/recipe_report.xml',
         'views/ingredient_stocktake_views.xml',
         'wizard/quick_ingredient_views.xml',
         'wizard/quick_product_views.xml',
+        'wizard/usage_variance_views.xml',
+        'wizard/menu_engineering_views.xml',
+        'wizard/price_simulation_views.xml',
+        'wizard/requirement_planner_views.xml',
+        'wizard/bulk_repricing_views.xml',
+        'wizard/recipe_bundle_views.xml',
         'views/dashboard_views.xml',
         'views/restaurant_recipe_views.xml',
         'views/product_views.xml',
+        'views/recipe_consumption_views.xml',
+        'views/recipe_bom_drift_views.xml',
+        'views/recipe_perf_views.xml',
+        'views/recipe_cost_history_views.xml',
         'views/res_config_settings_views.xml',
         'views/menu_views.xml',
         'data/dashboard_data.xml',
+        'data/ir_cron_data.xml',
+        'data/mail_activity_data.xml',
     ],
     'assets': {},
     'pre_init_hook': 'pre_init_hook',
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+from . import benchmark
+from . import pos_load
+from . import revaluation
+from . import bundle
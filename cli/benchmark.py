@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from odoo import api, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+
+class RecipeBenchmark(Command):
+    """Benchmark recipe costing on synthetic catalogs of n and 10n records and print a JSON report"""
+    name = 'recipe_benchmark'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog=f'{Path(sys.argv[0]).name} {self.name}',
+            description=self.__doc__,
+        )
+        parser.add_argument('--ingredients', type=int, default=50, help="number of ingredients, n")
+        parser.add_argument('--recipes', type=int, default=20, help="number of recipes, n")
+        parser.add_argument('--lines', type=int, default=8, help="ingredient lines per recipe")
+        parser.add_argument('--depth', type=int, default=2, help="sub-recipe nesting depth")
+        parser.add_argument('--stocktake-size', type=int, default=20, help="lines of the validated stocktake, n")
+        parser.add_argument('--upgrade', type=int, metavar='PRODUCTS',
+                            help="also time the install/upgrade column fill on this many products")
+        parser.add_argument('--query-plans', type=int, metavar='PRODUCTS',
+                            help="also check the lookup query plans on this many products")
+        parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+        opts, odoo_args = parser.parse_known_args(cmdargs)
+
+        config.parse_config(odoo_args, setup_logging=True)
+        dbname = config['db_name']
+        if not dbname:
+            sys.exit("The database to benchmark must be given with -d")
+
+        registry = Registry(dbname)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            Benchmark = env['recipe.benchmark']
+            report = Benchmark._run_benchmarks(
+                ingredients=opts.ingredients,
+                recipes=opts.recipes,
+                lines=opts.lines,
+                depth=opts.depth,
+                stocktake_size=opts.stocktake_size,
+            )
+            if opts.upgrade:
+                report['upgrade'] = Benchmark._benchmark_upgrade(product_count=opts.upgrade)
+            if opts.query_plans:
+                try:
+                    report['query_plans'] = Benchmark._check_query_plans(product_count=opts.query_plans)
+                except AssertionError as e:
+                    report['query_plans'] = str(e)
+                    report['passed'] = False
+            cr.rollback()
+
+        output = json.dumps(report, indent=2)
+        if opts.output:
+            Path(opts.output).write_text(output)
+        else:
+            print(output)
+        sys.exit(0 if report['passed'] else 1)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from odoo import api, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.service.model import retrying
+from odoo.tools import config
+
+
+class RecipeBundle(Command):
+    """Export the recipes changed since a base bundle, or import a bundle from another database"""
+    name = 'recipe_bundle'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog=f'{Path(sys.argv[0]).name} {self.name}',
+            description=self.__doc__,
+        )
+        parser.add_argument('action', choices=['export', 'import'])
+        parser.add_argument('file', help="bundle file to write or read")
+        parser.add_argument('--base', help="id of the last bundle the receiving database applied, "
+                                           "every recipe is exported without it")
+        parser.add_argument('--batch-size', type=int, default=500, help="recipes imported per batch")
+        opts, odoo_args = parser.parse_known_args(cmdargs)
+
+        config.parse_config(odoo_args, setup_logging=True)
+        dbname = config['db_name']
+        if not dbname:
+            sys.exit("The database must be given with -d")
+
+        registry = Registry(dbname)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            Bundle = env['recipe.sync.bundle']
+            if opts.action == 'export':
+                data, stats = Bundle._export_bundle(base=opts.base)
+                Path(opts.file).write_bytes(data)
+            else:
+                data = Path(opts.file).read_bytes()
+                # Recipes saved meanwhile by the users make the import start over, as an RPC call would
+                stats = retrying(lambda: Bundle._import_bundle(data, batch_size=opts.batch_size), env)
+        print(json.dumps(stats, indent=2))
+        sys.exit(1 if stats.get('errors') else 0)
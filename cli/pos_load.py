@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+import odoo
+from odoo import api, fields, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.service.model import retrying
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Seconds between two samples of the lock waits
+LOCK_SAMPLE_INTERVAL = 0.1
+
+
+def _make_order(session, menu_items, payment_method_id, lines_per_order, rng):
+    """One paid order in the format the POS front end syncs"""
+    lines = []
+    for product_id, name, price in rng.sample(menu_items, min(lines_per_order, len(menu_items))):
+        qty = rng.randint(1, 3)
+        lines.append([0, 0, {
+            'product_id': product_id,
+            'full_product_name': name,
+            'qty': qty,
+            'price_unit': price,
+            'price_subtotal': qty * price,
+            'price_subtotal_incl': qty * price,
+            'discount': 0,
+            'tax_ids': [[6, False, []]],
+            'uuid': str(uuid.uuid4()),
+        }])
+    total = sum(line[2]['price_subtotal_incl'] for line in lines)
+    now = fields.Datetime.to_string(fields.Datetime.now())
+    return {
+        'uuid': str(uuid.uuid4()),
+        'session_id': session['id'],
+        'user_id': session['user_id'],
+        'pricelist_id': session['pricelist_id'],
+        'fiscal_position_id': False,
+        'partner_id': False,
+        'date_order': now,
+        'state': 'paid',
+        'to_invoice': False,
+        'lines': lines,
+        'payment_ids': [[0, 0, {
+            'amount': total,
+            'payment_method_id': payment_method_id,
+            'payment_date': now,
+        }]],
+        'amount_total': total,
+        'amount_tax': 0,
+        'amount_paid': total,
+        'amount_return': 0,
+    }
+
+
+def _run_worker(args):
+    """Sync order batches from one process, returning (batch latencies, order count, failed batches)"""
+    dbname, session, menu_items, payment_method_id, opts, worker = args
+    rng = random.Random(opts['seed'] * 1000 + worker)
+    registry = Registry(dbname)
+    latencies, orders, failures = [], 0, 0
+    for _batch in range(opts['batches']):
+        batch = [
+            _make_order(session, menu_items, payment_method_id, opts['lines_per_order'], rng)
+            for _order in range(opts['batch_size'])
+        ]
+        start = time.perf_counter()
+        try:
+            with registry.cursor() as cr:
+                env = api.Environment(cr, session['user_id'], {})
+                # Same retry on concurrency errors as the RPC layer
+                retrying(lambda: env['pos.order'].sync_from_ui(batch), env)
+            orders += len(batch)
+        except Exception:
+            _logger.exception("Worker %s: batch failed", worker)
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, orders, failures
+
+
+def _sample_lock_waits(cr):
+    """Backends of this database currently waiting on a lock, by kind of lock"""
+    cr.execute("""
+        SELECT wait_event, COUNT(*)
+          FROM pg_stat_activity
+         WHERE datname = current_database()
+           AND wait_event_type = 'Lock'
+      GROUP BY wait_event
+    """)
+    return dict(cr.fetchall())
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)}
+
+
+class RecipePosLoad(Command):
+    """Simulate a POS rush on recipe kits and print throughput, latencies and lock waits as JSON"""
+    name = 'recipe_pos_load'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog=f'{Path(sys.argv[0]).name} {self.name}',
+            description=self.__doc__,
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="order syncing processes")
+        parser.add_argument('--batches', type=int, default=20, help="batches synced by each worker")
+        parser.add_argument('--batch-size', type=int, default=10, help="orders per batch")
+        parser.add_argument('--lines-per-order', type=int, default=3, help="menu items per order")
+        parser.add_argument('--recipes', type=int, default=100, help="recipes of the synthetic menu")
+        parser.add_argument('--ingredients', type=int, default=300, help="ingredients of the synthetic menu")
+        parser.add_argument('--lines', type=int, default=6, help="ingredient lines per recipe")
+        parser.add_argument('--depth', type=int, default=1, help="sub-recipe nesting depth")
+        parser.add_argument('--seed', type=int, default=42, help="seed of the order composition")
+        parser.add_argument('--close', action='store_true', help="also time the session closing")
+        parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+        opts, odoo_args = parser.parse_known_args(cmdargs)
+
+        config.parse_config(odoo_args, setup_logging=True)
+        dbname = config['db_name']
+        if not dbname:
+            sys.exit("The database to load must be given with -d")
+
+        # The menu and the session must be committed for the workers to see them
+        registry = Registry(dbname)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            session, menu_items, payment_method = env['recipe.benchmark']._prepare_pos_load(
+                opts.recipes, opts.ingredients, opts.lines, opts.depth)
+            session_data = {
+                'id': session.id,
+                'user_id': session.user_id.id,
+                'pricelist_id': session.config_id.pricelist_id.id,
+            }
+            menu = [(product.id, product.display_name, product.lst_price) for product in menu_items]
+            payment_method_id = payment_method.id
+
+        # Workers open their own connections
+        odoo.sql_db.close_all()
+        worker_opts = {
+            'batches': opts.batches,
+            'batch_size': opts.batch_size,
+            'lines_per_order': opts.lines_per_order,
+            'seed': opts.seed,
+        }
+        tasks = [(dbname, session_data, menu, payment_method_id, worker_opts, worker)
+                 for worker in range(opts.workers)]
+
+        lock_waits = Counter()
+        lock_samples = samples_with_waits = max_waiters = 0
+        start = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(opts.workers) as pool:
+            result = pool.map_async(_run_worker, tasks)
+            with registry.cursor() as cr:
+                while not result.ready():
+                    waits = _sample_lock_waits(cr)
+                    cr.rollback()
+                    lock_samples += 1
+                    if waits:
+                        samples_with_waits += 1
+                        max_waiters = max(max_waiters, sum(waits.values()))
+                        lock_waits.update(waits)
+                    time.sleep(LOCK_SAMPLE_INTERVAL)
+            worker_results = result.get()
+        seconds = time.perf_counter() - start
+
+        latencies = [latency for worker_latencies, _orders, _failures in worker_results
+                     for latency in worker_latencies]
+        orders = sum(worker_orders for _latencies, worker_orders, _failures in worker_results)
+        report = {
+            'params': vars(opts),
+            'session_id': session_data['id'],
+            'seconds': round(seconds, 3),
+            'orders': orders,
+            'failed_batches': sum(failures for _latencies, _orders, failures in worker_results),
+            'orders_per_minute': round(orders / seconds * 60, 1) if seconds else 0,
+            'batch_latency': _percentiles(latencies),
+            'order_latency': _percentiles([latency / opts.batch_size for latency in latencies]),
+            'lock_waits': {
+                'samples': lock_samples,
+                'samples_with_waits': samples_with_waits,
+                'max_waiting_backends': max_waiters,
+                'by_lock': dict(lock_waits),
+            },
+        }
+
+        if opts.close:
+            with registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                start = time.perf_counter()
+                env['pos.session'].browse(session_data['id']).action_pos_session_closing_control()
+                report['close_seconds'] = round(time.perf_counter() - start, 3)
+
+        output = json.dumps(report, indent=2)
+        if opts.output:
+            Path(opts.output).write_text(output)
+        else:
+            print(output)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from pathlib import Path
+
+import odoo
+from odoo import api, fields, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+
+def _process_shard(args):
+    """Revalue one shard with its own cursor"""
+    dbname, shard_id, chunk_size = args
+    registry = Registry(dbname)
+    try:
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env['recipe.revaluation.shard'].browse(shard_id)._process(chunk_size=chunk_size)
+    except Exception:
+        # The shard keeps its checkpoint, a new run with --resume picks it up again
+        _logger.exception("Recipe revaluation: shard %s failed", shard_id)
+        return shard_id, False
+    return shard_id, True
+
+
+class RecipeRevaluation(Command):
+    """Revalue every recipe in parallel shards: resync the kits, recompute the costs and update the product costs"""
+    name = 'recipe_revaluation'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog=f'{Path(sys.argv[0]).name} {self.name}',
+            description=self.__doc__,
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="revaluation processes")
+        parser.add_argument('--shard-mode', choices=['level', 'range'], default='level',
+                            help="level: sub-recipes before the recipes using them; range: id ranges only")
+        parser.add_argument('--shard-size', type=int, default=200, help="recipes per shard")
+        parser.add_argument('--chunk-size', type=int, default=50, help="recipes per commit")
+        parser.add_argument('--resume', type=int, nargs='?', const=0, metavar='RUN_ID',
+                            help="resume this run, or the last unfinished one")
+        parser.add_argument('--output', help="write the JSON summary to this file instead of stdout")
+        opts, odoo_args = parser.parse_known_args(cmdargs)
+
+        config.parse_config(odoo_args, setup_logging=True)
+        dbname = config['db_name']
+        if not dbname:
+            sys.exit("The database to revalue must be given with -d")
+
+        registry = Registry(dbname)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            Run = env['recipe.revaluation.run']
+            if opts.resume is None:
+                run = Run._create_run(shard_mode=opts.shard_mode, shard_size=opts.shard_size)
+            elif opts.resume:
+                run = Run.browse(opts.resume).exists()
+            else:
+                run = Run.search([('state', '=', 'running')], limit=1)
+            if not run:
+                sys.exit("No revaluation run to resume")
+            run_id = run.id
+            levels = [(level, shards.ids) for level, shards in run._get_pending_levels()]
+            _logger.info("Recipe revaluation %s: %d shards over %d levels to process",
+                         run_id, sum(len(shard_ids) for _level, shard_ids in levels), len(levels))
+
+        # Workers open their own connections
+        odoo.sql_db.close_all()
+        failed = []
+        with multiprocessing.get_context('fork').Pool(opts.workers) as pool:
+            for level, shard_ids in levels:
+                results = pool.map(_process_shard, [(dbname, shard_id, opts.chunk_size) for shard_id in shard_ids])
+                failed = [shard_id for shard_id, success in results if not success]
+                if failed:
+                    # Upper levels are costed from this one, stop until it is complete
+                    _logger.error("Recipe revaluation %s: level %s left %d shards unfinished", run_id, level, len(failed))
+                    break
+                _logger.info("Recipe revaluation %s: level %s done", run_id, level)
+
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            run = env['recipe.revaluation.run'].browse(run_id)
+            if not failed:
+                run.write({'state': 'done', 'date_done': fields.Datetime.now()})
+            summary = run._get_summary()
+            summary['failed_shards'] = failed
+
+        output = json.dumps(summary, indent=2)
+        if opts.output:
+            Path(opts.output).write_text(output)
+        else:
+            print(output)
+        sys.exit(1 if failed else 0)
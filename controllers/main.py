@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+
+from werkzeug.exceptions import BadRequest, NotFound
+
+from odoo import api, http
+from odoo.http import request
+
+# Stored fields of each feed, after the (id, write_date) keyset columns
+COSTING_FEEDS = {
+    'recipes': ('restaurant.recipe', [
+        'name', 'active', 'product_id', 'product_tmpl_id', 'recipe_type', 'portion_size', 'currency_id',
+        'total_cost', 'cost_per_portion', 'food_cost_percentage', 'profit_margin', 'margin_alert_state',
+    ]),
+    'lines': ('recipe.ingredient.line', [
+        'recipe_id', 'sequence', 'product_id', 'quantity', 'uom_id', 'cost',
+    ]),
+}
+
+FEED_CHUNK_SIZE = 2000
+
+
+def _json_default(value):
+    # Microseconds are kept, the next pull resumes from the exact write_date
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime.datetime) else value.isoformat()
+    raise TypeError(f"{value!r} is not JSON serializable")
+
+
+class CostingFeedController(http.Controller):
+
+    @http.route('/pos_recipe_costing/feed/<string:feed>', type='http', auth='user', methods=['GET'], readonly=True)
+    def costing_feed(self, feed, since=None, after_id=0, limit=None, **kwargs):
+        """Stream the stored costing facts as JSON Lines, ordered by (write_date, id).
+
+        Incremental pulls pass the write_date and id of the last row received
+        as ``since`` and ``after_id``. Only the rows older than the oldest
+        transaction still running are served: the others may still be joined
+        by rows written with an earlier write_date.
+        """
+        if feed not in COSTING_FEEDS:
+            raise NotFound()
+        model_name, fnames = COSTING_FEEDS[feed]
+        try:
+            since = since and datetime.datetime.fromisoformat(since)
+            after_id = int(after_id)
+            limit = limit and int(limit)
+        except ValueError:
+            raise BadRequest("since must be an ISO datetime, after_id and limit integers")
+        request.env[model_name].check_access('read')
+
+        rows = self._stream_rows(request.env.registry, request.env.uid, dict(request.env.context),
+                                 model_name, fnames, since, after_id, limit)
+        return request.make_response(rows, headers=[('Content-Type', 'application/x-ndjson; charset=utf-8')])
+
+    def _stream_rows(self, registry, uid, context, model_name, fnames, since, after_id, limit):
+        """Yield the feed rows chunk by chunk, with a cursor of their own.
+
+        The columns are read with plain SQL on the query of ``_search``, so
+        record rules apply but no field is computed or prefetched.
+        """
+        columns = ['id', 'write_date'] + fnames
+        with registry.cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            Model = env[model_name].with_context(active_test=False)
+            horizon = env['restaurant.recipe']._get_write_date_horizon()
+            sent = 0
+            while limit is None or sent < limit:
+                size = FEED_CHUNK_SIZE if limit is None else min(FEED_CHUNK_SIZE, limit - sent)
+                domain = [('write_date', '<', horizon)]
+                if since:
+                    domain += ['|', ('write_date', '>', since),
+                               '&', ('write_date', '=', since), ('id', '>', after_id)]
+                query = Model._search(domain, order='write_date, id', limit=size)
+                rows = env.execute_query(query.select(*[
+                    Model._field_to_sql(Model._table, fname, query) for fname in columns
+                ]))
+                for row in rows:
+                    yield json.dumps(dict(zip(columns, row)), default=_json_default) + '\n'
+                sent += len(rows)
+                if len(rows) < size:
+                    break
+                after_id, since = rows[-1][0], rows[-1][1]
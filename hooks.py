@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
 
+from odoo.tools.sql import column_exists, create_column, table_exists
+
 _logger = logging.getLogger(__name__)
 
 
@@ -8,6 +10,7 @@ def pre_init_hook(env):
     """Clean up before module installation/upgrade"""
     _logger.info("pos_recipe_costing: Running pre_init_hook")
     _cleanup_orphaned_menus(env.cr)
+    _precreate_stored_columns(env)
 
 
 def post_init_hook(env):
@@ -46,3 +49,65 @@ def _cleanup_orphaned_menus(cr):
 
     except Exception as e:
         _logger.warning("Failed to cleanup orphaned menus: %s", str(e))
+
+
+def _create_missing_columns(cr, table, columns):
+    """Create the given columns when missing, returning whether any was created"""
+    created = False
+    for column, column_type in columns:
+        if not column_exists(cr, table, column):
+            create_column(cr, table, column, column_type)
+            created = True
+    return created
+
+
+def _precreate_stored_columns(env):
+    """Create and fill the new stored columns of the module with set-based SQL.
+
+    The ORM only recomputes a stored field when it creates its column, record
+    by record. Creating the columns first, and filling them with one UPDATE
+    each, keeps installs and upgrades fast on large product catalogs.
+    """
+    cr = env.cr
+    has_recipes = table_exists(cr, 'restaurant_recipe')
+
+    # Left NULL, i.e. False, unless a recipe points to the product
+    if _create_missing_columns(cr, 'product_template', [('has_recipe', 'boolean')]) and has_recipes:
+        cr.execute("""
+            UPDATE product_template pt
+               SET has_recipe = TRUE
+             WHERE EXISTS (SELECT 1 FROM restaurant_recipe r WHERE r.product_tmpl_id = pt.id)
+        """)
+        _logger.info("Filled has_recipe on %d product templates", cr.rowcount)
+    if _create_missing_columns(cr, 'product_product', [('has_recipe', 'boolean')]):
+        cr.execute("""
+            UPDATE product_product pp
+               SET has_recipe = TRUE
+              FROM product_template pt
+             WHERE pt.id = pp.product_tmpl_id
+               AND pt.has_recipe
+        """)
+        _logger.info("Filled has_recipe on %d product variants", cr.rowcount)
+    # On a fresh install the template flag does not exist yet either, the ORM creates it
+    if (_create_missing_columns(cr, 'product_product', [('is_ingredient', 'boolean')])
+            and column_exists(cr, 'product_template', 'is_ingredient')):
+        cr.execute("""
+            UPDATE product_product pp
+               SET is_ingredient = TRUE
+              FROM product_template pt
+             WHERE pt.id = pp.product_tmpl_id
+               AND pt.is_ingredient
+        """)
+        _logger.info("Filled is_ingredient on %d product variants", cr.rowcount)
+
+    if not has_recipes:
+        return
+
+    if _create_missing_columns(cr, 'mrp_bom', [('recipe_id', 'integer')]):
+        cr.execute("""
+            UPDATE mrp_bom b
+               SET recipe_id = r.id
+              FROM restaurant_recipe r
+             WHERE r.bom_id = b.id
+        """)
+        _logger.info("Linked %d BOMs to their recipe", cr.rowcount)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Post-migration: link the recipe lines to their kit lines"""
+    if not version:
+        return
+
+    # Lines saved before the link existed, paired with the kit line of the same
+    # ingredient in the recipe BOM, in order when an ingredient appears twice
+    cr.execute("""
+        WITH rl AS (
+            SELECT l.id, r.bom_id, l.product_id,
+                   ROW_NUMBER() OVER (PARTITION BY l.recipe_id, l.product_id ORDER BY l.sequence, l.id) AS n
+              FROM recipe_ingredient_line l
+              JOIN restaurant_recipe r ON r.id = l.recipe_id
+             WHERE l.bom_line_id IS NULL
+               AND r.bom_id IS NOT NULL
+        ), kl AS (
+            SELECT bl.id, bl.bom_id, bl.product_id,
+                   ROW_NUMBER() OVER (PARTITION BY bl.bom_id, bl.product_id ORDER BY bl.sequence, bl.id) AS n
+              FROM mrp_bom_line bl
+             WHERE bl.bom_id IN (SELECT bom_id FROM restaurant_recipe)
+               AND NOT EXISTS (SELECT 1 FROM recipe_ingredient_line l WHERE l.bom_line_id = bl.id)
+        )
+        UPDATE recipe_ingredient_line l
+           SET bom_line_id = kl.id
+          FROM rl
+          JOIN kl ON kl.bom_id = rl.bom_id AND kl.product_id = rl.product_id AND kl.n = rl.n
+         WHERE l.id = rl.id
+    """)
+    _logger.info("pos_recipe_costing: Linked %d recipe lines to their kit line", cr.rowcount)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+from odoo.addons.pos_recipe_costing.hooks import _precreate_stored_columns
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Pre-migration: create and fill new stored columns before the ORM recomputes them"""
+    if not version:
+        return
+
+    _logger.info("pos_recipe_costing: Pre-creating stored columns from version %s", version)
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    _precreate_stored_columns(env)
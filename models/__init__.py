@@ -1,7 +1,24 @@
 # -*- coding: utf-8 -*-
+from . import recipe_perf_sample
+from . import recipe_cost_source
+from . import costing_catalog
 from . import recipe_line
+from . import recipe_explosion
+from . import recipe_consumption
 from . import restaurant_recipe
+from . import recipe_cost_history
+from . import recipe_bom_drift
+from . import recipe_revaluation
+from . import recipe_sync_bundle
 from . import product_template
+from . import product_supplierinfo
+from . import res_company
+from . import res_currency_rate
 from . import res_config_settings
 from . import recipe_dashboard
 from . import ingredient_stocktake
+from . import mrp_bom
+from . import stock_move
+from . import stock_picking
+from . import pos_session
+from . import recipe_benchmark
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+import numpy as np
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+CATALOG_SEQUENCE = 'recipe_costing_catalog_seq'
+DIRTY_KEY = 'pos_recipe_costing.catalog_dirty'
+
+# One catalog per (database, company, currency) in each worker process
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def _to_coo(row_values, col_values):
+    """Index two id columns, returning (row ids, col ids, rows, cols)"""
+    row_ids, rows = np.unique(np.asarray(row_values, dtype=np.int32), return_inverse=True)
+    col_ids, cols = np.unique(np.asarray(col_values, dtype=np.int32), return_inverse=True)
+    return row_ids, col_ids, rows.astype(np.int32), cols.astype(np.int32)
+
+
+class CostingCatalog:
+    """Read-only array snapshot of the recipe costing structure of one company.
+
+    Prices are in the currency the catalog was loaded for.
+
+    Recipes are the rows of the line arrays; ingredients are their columns.
+    Quantities are kept as entered on the recipe lines, with the factor
+    converting them to the ingredient's stock UoM alongside.
+    """
+
+    def __init__(self, version, recipes, lines, explosion, prices, selling_prices):
+        self.version = version
+
+        recipe_ids, recipe_product_ids, portions = (zip(*recipes) if recipes else ((), (), ()))
+        self.recipe_ids = np.asarray(recipe_ids, dtype=np.int32)
+        self.recipe_product_ids = np.asarray(recipe_product_ids, dtype=np.int32)
+        self.portions = np.asarray(portions, dtype=np.float64)
+        self.selling_prices = np.asarray(selling_prices, dtype=np.float64)
+
+        line_recipe_ids, line_product_ids, quantities, uom_factors = (zip(*lines) if lines else ((), (), (), ()))
+        _recipe_ids, self.ingredient_ids, rows, self.line_cols = _to_coo(line_recipe_ids, line_product_ids)
+        # Line rows index the catalog recipes, which include recipes without lines
+        self.line_rows = np.searchsorted(self.recipe_ids, _recipe_ids)[rows].astype(np.int32)
+        self.line_quantities = np.asarray(quantities, dtype=np.float64)
+        self.line_uom_factors = np.asarray(uom_factors, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+
+        item_ids, component_ids, quantities = (zip(*explosion) if explosion else ((), (), ()))
+        (self.explosion_item_ids, self.explosion_component_ids,
+         self.explosion_rows, self.explosion_cols) = _to_coo(item_ids, component_ids)
+        self.explosion_quantities = np.asarray(quantities, dtype=np.float64)
+
+    def costing_matrix(self):
+        """(recipe ids, ingredient ids, rows, cols, qty per portion) as costed on the recipes"""
+        qty = self.line_quantities / self.portions[self.line_rows]
+        return self.recipe_ids, self.ingredient_ids, self.line_rows, self.line_cols, qty
+
+    def direct_matrix(self):
+        """(menu item ids, ingredient ids, rows, cols, stock UoM qty per unit sold)"""
+        item_ids, rows = np.unique(self.recipe_product_ids[self.line_rows], return_inverse=True)
+        qty = self.line_quantities * self.line_uom_factors / self.portions[self.line_rows]
+        return item_ids, self.ingredient_ids, rows, self.line_cols, qty
+
+    def explosion_matrix(self):
+        """(menu item ids, ingredient ids, rows, cols, stock UoM qty per unit sold), sub-recipes flattened"""
+        return (self.explosion_item_ids, self.explosion_component_ids,
+                self.explosion_rows, self.explosion_cols, self.explosion_quantities)
+
+    def costs_per_portion(self, prices=None):
+        """Cost per portion of every recipe for a price vector over ``ingredient_ids``"""
+        prices = self.prices if prices is None else prices
+        _recipe_ids, _ingredient_ids, rows, cols, qty = self.costing_matrix()
+        return np.bincount(rows, weights=qty * prices[cols], minlength=len(self.recipe_ids))
+
+
+class RecipeCostingCatalog(models.AbstractModel):
+    _name = 'recipe.costing.catalog'
+    _description = 'Recipe Costing Catalog'
+
+    def init(self):
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {CATALOG_SEQUENCE}")
+
+    @api.model
+    def _get_catalog(self, currency=None):
+        """Return the costing catalog of the current company in ``currency``, loading it when stale.
+
+        The currency defaults to the company's. The catalog is shared by the
+        requests of this worker and reloaded, on a fresh cursor, only when
+        another transaction signalled a change through the sequence. A
+        transaction with pending changes of its own gets a private snapshot.
+        """
+        currency = currency or self.env.company.currency_id
+        if self.env.cr.postcommit.data.get(DIRTY_KEY):
+            return self._load_catalog(None, currency)
+
+        self.env.cr.execute(f"SELECT last_value FROM {CATALOG_SEQUENCE}")
+        version = self.env.cr.fetchone()[0]
+        key = (self.env.cr.dbname, self.env.company.id, currency.id)
+        catalog = _catalogs.get(key)
+        if catalog is None or catalog.version != version:
+            with _catalogs_lock:
+                catalog = _catalogs.get(key)
+                if catalog is None or catalog.version != version:
+                    # The sequence is not transactional: the change behind this version
+                    # may be newer than the snapshot of this transaction
+                    with self.env.registry.cursor() as cr:
+                        env = self.env(cr=cr)
+                        catalog = _catalogs[key] = self.with_env(env)._load_catalog(
+                            version, currency.with_env(env))
+        return catalog
+
+    @api.model
+    def _load_catalog(self, version, currency):
+        self.env.flush_all()
+        cr = self.env.cr
+        company = self.env.company
+        cr.execute("""
+            SELECT id, product_id, COALESCE(NULLIF(portion_size, 0), 1)
+              FROM restaurant_recipe
+             WHERE active
+               AND company_id = %s
+          ORDER BY id
+        """, [company.id])
+        recipes = cr.fetchall()
+        cr.execute("""
+            SELECT l.recipe_id, l.product_id, l.quantity, pu.factor / lu.factor
+              FROM recipe_ingredient_line l
+              JOIN restaurant_recipe r ON r.id = l.recipe_id
+              JOIN uom_uom lu ON lu.id = l.uom_id
+              JOIN product_product pp ON pp.id = l.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+              JOIN uom_uom pu ON pu.id = pt.uom_id
+             WHERE r.active
+               AND r.company_id = %s
+        """, [company.id])
+        lines = cr.fetchall()
+        cr.execute("""
+            SELECT r.product_id, e.product_id, e.quantity
+              FROM recipe_explosion_line e
+              JOIN restaurant_recipe r ON r.id = e.recipe_id
+             WHERE r.active
+               AND r.company_id = %s
+        """, [company.id])
+        explosion = cr.fetchall()
+
+        CostSource = self.env['recipe.cost.source']
+        rate = CostSource._get_conversion_rate(
+            company.currency_id, currency, company, company._get_recipe_rate_date())
+        Product = self.env['product.product'].with_company(company)
+        ingredient_ids = sorted({line[1] for line in lines})
+        ingredient_prices = CostSource._get_prices(Product.browse(ingredient_ids), company)
+        prices = [ingredient_prices[ingredient_id] * rate for ingredient_id in ingredient_ids]
+        menu_items = Product.browse([recipe[1] for recipe in recipes])
+        selling_prices = [product.lst_price * rate for product in menu_items]
+
+        catalog = CostingCatalog(version, recipes, lines, explosion, prices, selling_prices)
+        _logger.debug("Loaded recipe costing catalog: %d recipes, %d lines in %s",
+                      len(recipes), len(lines), currency.name)
+        return catalog
+
+    @api.model
+    def _invalidate_catalog(self):
+        """Signal the other workers to reload their catalog once this transaction commits.
+
+        Called on every change the catalogs are built from: recipes, lines and
+        products, and through ``recipe.cost.source`` the prices of the cost
+        sources and the exchange rates.
+        """
+        data = self.env.cr.postcommit.data
+        if data.get(DIRTY_KEY):
+            return
+        data[DIRTY_KEY] = True
+        registry = self.env.registry
+        dbname = self.env.cr.dbname
+
+        @self.env.cr.postcommit.add
+        def signal_catalog_change():
+            with registry.cursor() as cr:
+                cr.execute(f"SELECT nextval('{CATALOG_SEQUENCE}')")
+            with _catalogs_lock:
+                for key in [key for key in _catalogs if key[0] == dbname]:
+                    del _catalogs[key]
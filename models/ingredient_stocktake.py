@@ -1,7 +1,31 @@
 # -*- coding: utf-8 -*-
-from odoo import api, fields, models, _
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from odoo import api, fields, models, Command, _
 from odoo.exceptions import UserError
 
+from .recipe_perf_sample import instrument
+
+_logger = logging.getLogger(__name__)
+
+CYCLE_COUNT_PARAM = 'pos_recipe_costing.cycle_count'
+CYCLE_COUNT_SIZE_PARAM = 'pos_recipe_costing.cycle_count_size'
+CYCLE_COUNT_START_PARAM = 'pos_recipe_costing.cycle_count_start'
+DEFAULT_CYCLE_COUNT_SIZE = 40
+
+ABC_CLASSES = [('a', 'A'), ('b', 'B'), ('c', 'C')]
+
+# Share of the consumption value covered by the ingredients of class A, then A and B
+ABC_CUMULATIVE_SHARES = {'a': 0.80, 'b': 0.95}
+
+# Days of stock moves the consumption value is computed on
+ABC_PERIOD_DAYS = 90
+
+# Days between two counts of an ingredient, per class
+CYCLE_COUNT_INTERVALS = {'a': 7, 'b': 30, 'c': 91}
+
 
 class IngredientStocktake(models.Model):
     _name = 'ingredient.stocktake'
@@ -12,6 +36,7 @@ class IngredientStocktake(models.Model):
     name = fields.Char(string='Reference', required=True, copy=False, readonly=True,
                        default=lambda self: _('New'))
     date = fields.Date(string='Date', required=True, default=fields.Date.context_today)
+    date_done = fields.Datetime(string='Validated On', readonly=True, copy=False)
     user_id = fields.Many2one('res.users', string='Responsible', default=lambda self: self.env.user)
     company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.company)
 
@@ -37,6 +62,13 @@ class IngredientStocktake(models.Model):
         help="Account for inventory losses (counted < system)"
     )
     account_move_id = fields.Many2one('account.move', string='Journal Entry', readonly=True)
+    abc_class = fields.Selection(
+        ABC_CLASSES,
+        string='Cycle Count Class',
+        readonly=True,
+        copy=False,
+        help="Set on the partial counts generated by the cycle count scheduler"
+    )
 
     @api.model
     def _default_gain_account(self):
@@ -135,7 +167,16 @@ class IngredientStocktake(models.Model):
             self._create_account_move()
 
         self.state = 'done'
+        self.date_done = fields.Datetime.now()
+        # Restart the cycle count rotation of the counted ingredients, in this company
+        self.line_ids.product_id.sudo().with_company(self.company_id).write({'last_cycle_count_date': self.date})
 
+    def _get_count_datetime(self):
+        """Moment the count applies to: validation time, else the end of the count date"""
+        self.ensure_one()
+        return self.date_done or datetime.combine(self.date, time.max)
+
+    @instrument('stocktake.create_inventory_adjustment')
     def _create_inventory_adjustment(self):
         """Adjust inventory using stock.quant"""
         warehouse = self.env['stock.warehouse'].search([('company_id', '=', self.company_id.id)], limit=1)
@@ -172,6 +213,7 @@ class IngredientStocktake(models.Model):
                 })
                 quant.action_apply_inventory()
 
+    @instrument('stocktake.create_account_move')
     def _create_account_move(self):
         lines_with_variance = self.line_ids.filtered(lambda l: l.variance_qty != 0)
         if not lines_with_variance:
@@ -234,6 +276,133 @@ class IngredientStocktake(models.Model):
             account_move.action_post()
             self.account_move_id = account_move
 
+    @api.model
+    def _classify_ingredients_abc(self):
+        """Class the storable ingredients of the current company by consumption value.
+
+        One aggregate over the stock moves of the company. The ingredients
+        making the first 80% of the consumption value are class A, the next 15%
+        class B, and the rest, including unused ones, class C. The class is
+        company dependent, each company counting its own stock.
+        """
+        self.env.flush_all()
+        company = self.env.company
+        self.env.cr.execute("""
+            SELECT pp.id,
+                   COALESCE(SUM(m.product_qty), 0) * COALESCE((pp.standard_price->>%(company)s)::float, 0) AS value
+              FROM product_product pp
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+         LEFT JOIN stock_move m
+                ON m.product_id = pp.id
+               AND m.state = 'done'
+               AND m.company_id = %(company_id)s
+               AND m.date >= %(date_from)s
+               AND m.location_id IN (SELECT id FROM stock_location WHERE usage = 'internal')
+               AND m.location_dest_id IN (SELECT id FROM stock_location WHERE usage IN ('customer', 'production'))
+             WHERE pp.is_ingredient
+               AND pp.active
+               AND pt.is_storable
+               AND (pt.company_id IS NULL OR pt.company_id = %(company_id)s)
+          GROUP BY pp.id
+          ORDER BY value DESC, pp.id
+        """, {
+            'company': str(company.id),
+            'company_id': company.id,
+            'date_from': fields.Datetime.now() - timedelta(days=ABC_PERIOD_DAYS),
+        })
+        rows = self.env.cr.fetchall()
+        total = sum(value for _product_id, value in rows)
+
+        classes = defaultdict(list)
+        cumulated = 0.0
+        for product_id, value in rows:
+            share = cumulated / total if total else 1.0
+            cumulated += value
+            if value and share < ABC_CUMULATIVE_SHARES['a']:
+                classes['a'].append(product_id)
+            elif value and share < ABC_CUMULATIVE_SHARES['b']:
+                classes['b'].append(product_id)
+            else:
+                classes['c'].append(product_id)
+
+        for abc_class, product_ids in classes.items():
+            self.env.cr.execute("""
+                UPDATE product_product
+                   SET abc_class = COALESCE(abc_class, '{}'::jsonb) || jsonb_build_object(%(company)s, %(class)s)
+                 WHERE id = ANY(%(product_ids)s)
+                   AND (abc_class->>%(company)s) IS DISTINCT FROM %(class)s
+            """, {'company': str(company.id), 'class': abc_class, 'product_ids': product_ids})
+        self.env['product.product'].invalidate_model(['abc_class'])
+        return {abc_class: len(product_ids) for abc_class, product_ids in classes.items()}
+
+    @api.model
+    def _get_due_cycle_counts(self):
+        """Return {class: [product ids]} of the current company's ingredients due for counting.
+
+        Most overdue first. Ingredients never counted are spread over the
+        interval of their class by id, from a fixed date: when cycle counting
+        started, or the ingredient was created. A due ingredient stays due
+        until counted, whether it was left out by the count size or a day was
+        skipped.
+        """
+        company = self.env.company
+        today = fields.Date.context_today(self)
+        start = fields.Date.to_date(self.env['ir.config_parameter'].sudo().get_param(CYCLE_COUNT_START_PARAM)) or today
+        counting = self.env['ingredient.stocktake.line'].search([
+            ('stocktake_id.state', 'in', ('draft', 'in_progress')),
+            ('stocktake_id.company_id', '=', company.id),
+        ]).product_id
+        ingredients = self.env['product.product'].search_fetch([
+            ('is_ingredient', '=', True),
+            ('is_storable', '=', True),
+            ('company_id', 'in', [False, company.id]),
+            ('abc_class', '!=', False),
+            ('id', 'not in', counting.ids),
+        ], ['abc_class', 'last_cycle_count_date', 'create_date'])
+
+        due = defaultdict(list)
+        for product in ingredients:
+            interval = CYCLE_COUNT_INTERVALS[product.abc_class]
+            if product.last_cycle_count_date:
+                due_date = product.last_cycle_count_date + timedelta(days=interval)
+            else:
+                anchor = max(start, product.create_date.date())
+                due_date = anchor + timedelta(days=product.id % interval)
+            if due_date <= today:
+                due[product.abc_class].append((due_date, product.id))
+        return {
+            abc_class: [product_id for _due_date, product_id in sorted(products)]
+            for abc_class, products in due.items()
+        }
+
+    @api.model
+    def _cron_cycle_counts(self):
+        """Reclassify the ingredients and open one small count per class with the ingredients due.
+
+        Each company is classed and counted on its own stock.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if not ICP.get_param(CYCLE_COUNT_PARAM):
+            return
+        if not ICP.get_param(CYCLE_COUNT_START_PARAM):
+            ICP.set_param(CYCLE_COUNT_START_PARAM, fields.Date.to_string(fields.Date.context_today(self)))
+        size = int(ICP.get_param(CYCLE_COUNT_SIZE_PARAM, DEFAULT_CYCLE_COUNT_SIZE)) or DEFAULT_CYCLE_COUNT_SIZE
+        labels = dict(ABC_CLASSES)
+        stocktakes = self.browse()
+        for company in self.env['res.company'].sudo().search([]):
+            Stocktake = self.with_company(company)
+            Stocktake._classify_ingredients_abc()
+            stocktakes |= Stocktake.create([{
+                'company_id': company.id,
+                'abc_class': abc_class,
+                'notes': _('Cycle count of class %s ingredients', labels[abc_class]),
+                # Ingredients beyond the size are left for the next days
+                'line_ids': [Command.create({'product_id': product_id}) for product_id in product_ids[:size]],
+            } for abc_class, product_ids in sorted(Stocktake._get_due_cycle_counts().items())])
+        if stocktakes:
+            _logger.info("Cycle counts: opened %s", ', '.join(stocktakes.mapped('name')))
+        return stocktakes
+
     def action_cancel(self):
         self.ensure_one()
         if self.state == 'done':
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class MrpBom(models.Model):
+    _inherit = 'mrp.bom'
+
+    recipe_id = fields.Many2one(
+        'restaurant.recipe',
+        string='Generated by Recipe',
+        index='btree_not_null',
+        readonly=True,
+        copy=False,
+        ondelete='set null'
+    )
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import models
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import float_compare
+
+_logger = logging.getLogger(__name__)
+
+
+class PosSession(models.Model):
+    _inherit = 'pos.session'
+
+    def _create_picking_at_end_of_session(self):
+        res = super()._create_picking_at_end_of_session()
+        self._post_recipe_consumption()
+        return res
+
+    def _validate_session(self, balancing_account=False, amount_to_balance=0, bank_payment_method_diffs=None):
+        self._post_recipe_consumption()
+        return super()._validate_session(
+            balancing_account=balancing_account,
+            amount_to_balance=amount_to_balance,
+            bank_payment_method_diffs=bank_payment_method_diffs,
+        )
+
+    def _post_recipe_consumption(self):
+        """Post the recorded recipe usage as one move per ingredient and location"""
+        Consumption = self.env['recipe.consumption.line'].sudo()
+        Move = self.env['stock.move'].sudo()
+        for session in self:
+            groups = Consumption._read_group(
+                [('session_id', '=', session.id), ('posted', '=', False)],
+                ['product_id', 'location_id', 'location_dest_id'],
+                ['quantity:sum', 'id:recordset'],
+            )
+            if not groups:
+                continue
+
+            picking_type = session.config_id.picking_type_id
+            pickings = {}
+            for product, location, location_dest, qty, lines in groups:
+                direction = float_compare(qty, 0, precision_rounding=product.uom_id.rounding)
+                if not direction:
+                    lines.write({'posted': True})
+                    continue
+                if direction < 0:
+                    # Refunds outweigh sales: bring the ingredients back
+                    location, location_dest = location_dest, location
+                key = (location, location_dest)
+                if key not in pickings:
+                    p_type = (picking_type.return_picking_type_id or picking_type) if direction < 0 else picking_type
+                    pickings[key] = self.env['stock.picking'].sudo().create({
+                        'picking_type_id': p_type.id,
+                        'location_id': location.id,
+                        'location_dest_id': location_dest.id,
+                        'origin': session.name,
+                        'pos_session_id': session.id,
+                    })
+                picking = pickings[key]
+                move = Move.create({
+                    'name': product.display_name,
+                    'product_id': product.id,
+                    'product_uom': product.uom_id.id,
+                    'product_uom_qty': abs(qty),
+                    'picking_id': picking.id,
+                    'picking_type_id': picking.picking_type_id.id,
+                    'location_id': location.id,
+                    'location_dest_id': location_dest.id,
+                    'company_id': session.company_id.id,
+                    'origin': session.name,
+                })
+                lines.write({'posted': True, 'move_id': move.id})
+
+            for picking in pickings.values():
+                moves = picking.move_ids.with_context(recipe_kit_exploded=True)._action_confirm()
+                for move in moves:
+                    move.quantity = move.product_uom_qty
+                moves.picked = True
+                try:
+                    with self.env.cr.savepoint():
+                        picking._action_done()
+                except (UserError, ValidationError) as e:
+                    _logger.warning(
+                        "Recipe consumption picking %s of session %s left to validate: %s",
+                        picking.name, session.name, e,
+                    )
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+# Vendor price fields read by the vendor price cost source
+SUPPLIER_PRICE_FIELDS = {
+    'price', 'discount', 'min_qty', 'currency_id', 'date_start', 'date_end',
+    'product_id', 'product_tmpl_id', 'company_id',
+}
+
+
+class ProductSupplierinfo(models.Model):
+    _inherit = 'product.supplierinfo'
+
+    def _recompute_recipe_costs(self):
+        """Recost the recipes using these vendor prices"""
+        CostSource = self.env['recipe.cost.source']
+        companies = CostSource._get_companies_using({'supplier'})
+        if companies:
+            products = self.product_id | self.product_tmpl_id.product_variant_ids
+            CostSource._recompute_costs(products, companies)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._recompute_recipe_costs()
+        return records
+
+    def write(self, vals):
+        if vals.keys() & {'product_id', 'product_tmpl_id'}:
+            # The products the vendor prices move away from
+            self._recompute_recipe_costs()
+        res = super().write(vals)
+        if vals.keys() & SUPPLIER_PRICE_FIELDS:
+            self._recompute_recipe_costs()
+        return res
+
+    def unlink(self):
+        self._recompute_recipe_costs()
+        return super().unlink()
@@ -1,5 +1,14 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
+
 from odoo import api, fields, models, _
+from odoo.osv import expression
+from odoo.tools.sql import create_index
+
+from .ingredient_stocktake import ABC_CLASSES
+
+# Product fields held by the recipe costing catalog
+CATALOG_PRODUCT_FIELDS = {'standard_price', 'list_price', 'lst_price', 'price_extra', 'uom_id'}
 
 
 class ProductTemplate(models.Model):
@@ -58,6 +67,24 @@ class ProductTemplate(models.Model):
         compute='_compute_used_in_recipes'
     )
 
+    def init(self):
+        super().init()
+        create_index(self.env.cr, 'product_template_available_in_pos_idx', self._table,
+                     ['id'], where='available_in_pos')
+        if self.env.registry.has_trigram:
+            # Same expression as the ORM uses for trigram searches on translated names
+            create_index(
+                self.env.cr, 'product_template_ingredient_name_trgm_idx', self._table,
+                ["(jsonb_path_query_array(name, '$.*')::text) gin_trgm_ops"],
+                method='gin', where='is_ingredient',
+            )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.keys() & CATALOG_PRODUCT_FIELDS:
+            self.env['recipe.costing.catalog']._invalidate_catalog()
+        return res
+
     @api.depends('recipe_ids')
     def _compute_has_recipe(self):
         for product in self:
@@ -79,12 +106,13 @@ class ProductTemplate(models.Model):
                 product.profit_margin = product.list_price
 
     def _compute_used_in_recipes(self):
-        RecipeLine = self.env['recipe.ingredient.line']
+        counts = defaultdict(int)
+        for variant, count in self.env['recipe.ingredient.line']._read_group(
+            [('product_id.product_tmpl_id', 'in', self.ids)], ['product_id'], ['__count'],
+        ):
+            counts[variant.product_tmpl_id] += count
         for product in self:
-            count = RecipeLine.search_count([
-                ('product_id.product_tmpl_id', '=', product.id)
-            ])
-            product.used_in_recipe_count = count
+            product.used_in_recipe_count = counts.get(product, 0)
 
     def action_view_recipes(self):
         self.ensure_one()
@@ -141,6 +169,10 @@ class ProductProduct(models.Model):
         related='product_tmpl_id.has_recipe',
         store=True
     )
+    is_ingredient = fields.Boolean(
+        related='product_tmpl_id.is_ingredient',
+        store=True
+    )
     food_cost_percentage = fields.Float(
         related='product_tmpl_id.food_cost_percentage'
     )
@@ -148,6 +180,65 @@ class ProductProduct(models.Model):
         related='product_tmpl_id.used_in_recipe_count'
     )
 
+    # Cycle counting
+    abc_class = fields.Selection(
+        ABC_CLASSES,
+        string='ABC Class',
+        readonly=True,
+        copy=False,
+        company_dependent=True,
+        help="Class by consumption value in the company, deciding how often the ingredient is cycle counted"
+    )
+    last_cycle_count_date = fields.Date(string='Last Counted', readonly=True, copy=False, company_dependent=True)
+
+    def init(self):
+        super().init()
+        cr = self.env.cr
+        create_index(cr, 'product_product_is_ingredient_idx', self._table, ['id'], where='is_ingredient')
+        if self.env.registry.has_trigram:
+            for column in ('default_code', 'barcode'):
+                create_index(
+                    cr, f'product_product_ingredient_{column}_trgm_idx', self._table,
+                    [f'{column} gin_trgm_ops'], method='gin', where='is_ingredient',
+                )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.keys() & CATALOG_PRODUCT_FIELDS:
+            self.env['recipe.costing.catalog']._invalidate_catalog()
+        return res
+
+    @api.model
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
+        """Ingredient autocomplete, ranking exact reference and barcode hits first.
+
+        Only used when the ``recipe_ingredient_search`` context key is set. All
+        conditions stay on ingredient products so the partial indexes apply.
+        """
+        if not (self.env.context.get('recipe_ingredient_search') and name
+                and operator in ('ilike', '=ilike', '=')):
+            return super()._name_search(name, domain, operator, limit=limit, order=order)
+
+        domain = expression.AND([domain or [], [('is_ingredient', '=', True)]])
+        product_ids = list(self._search(
+            expression.AND([domain, ['|', ('default_code', '=', name), ('barcode', '=', name)]]),
+            limit=limit, order=order,
+        ))
+        if limit is None or len(product_ids) < limit:
+            product_ids += self._search(expression.AND([
+                domain, [('id', 'not in', product_ids)], self._get_ingredient_search_domain(name, operator),
+            ]), limit=limit and limit - len(product_ids), order=order)
+        return product_ids
+
+    @api.model
+    def _get_ingredient_search_domain(self, name, operator='ilike'):
+        return [
+            '|', '|',
+            ('default_code', operator, name),
+            ('barcode', operator, name),
+            ('product_tmpl_id', 'any', [('is_ingredient', '=', True), ('name', operator, name)]),
+        ]
+
     def _compute_recipe_id(self):
         Recipe = self.env['restaurant.recipe']
         for product in self:
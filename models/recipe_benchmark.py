@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import time
+
+from odoo import api, fields, models, Command, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL
+
+from odoo.addons.pos_recipe_costing.hooks import _precreate_stored_columns
+
+_logger = logging.getLogger(__name__)
+
+# Stored computed columns the install/upgrade hooks fill with SQL
+PRECREATED_FIELDS = [
+    ('product.template', 'has_recipe'),
+    ('product.product', 'has_recipe'),
+    ('product.product', 'is_ingredient'),
+]
+
+# Throwaway schema of the upgrade benchmark, and the tables copied into it
+UPGRADE_SCHEMA = 'recipe_benchmark_upgrade'
+UPGRADE_TABLES = ['product_template', 'product_product', 'restaurant_recipe']
+
+# The operations are run on n and QUERY_SCALE * n records. Their query count
+# must stay the same, up to a logarithmic allowance for the ORM batching:
+# a count growing with the records is an N+1 regression.
+QUERY_SCALE = 10
+
+# Operations saving one kit per record by design, with their queries per
+# record, measured between both sizes so that no fixed part can hide a regression
+PER_RECORD_QUERIES = {
+    'sync_bom_write': 60,
+    'validate_stocktake': 150,
+    'create_recipe_bulk': 40,
+}
+
+
+class RecipeBenchmark(models.AbstractModel):
+    _name = 'recipe.benchmark'
+    _description = 'Recipe Costing Benchmarks'
+
+    @api.model
+    def _clone_rows(self, table, seed_id, count=None, overrides=None):
+        """Insert copies of one row, ``count`` times or once per override row.
+
+        ``overrides`` maps columns to an array of values, one copy being made
+        for each position of the arrays.
+        """
+        overrides = overrides or {}
+        self.env.cr.execute("""
+            SELECT column_name
+              FROM information_schema.columns
+             WHERE table_schema = current_schema()
+               AND table_name = %s
+               AND column_name != 'id'
+        """, [table])
+        columns = [name for name, in self.env.cr.fetchall()]
+        select = [
+            SQL("src.%s", SQL.identifier(column)) if column not in overrides
+            else SQL("new.%s", SQL.identifier(column))
+            for column in columns
+        ]
+        if overrides:
+            names = list(overrides)
+            source = SQL(
+                "unnest(%s) AS new(%s)",
+                SQL(", ").join(SQL("%s", values) for values in overrides.values()),
+                SQL(", ").join(SQL.identifier(name) for name in names),
+            )
+        else:
+            source = SQL("generate_series(1, %s) AS new", count)
+        self.env.cr.execute(SQL(
+            "INSERT INTO %s (%s) SELECT %s FROM %s src, %s WHERE src.id = %s RETURNING id",
+            SQL.identifier(table),
+            SQL(", ").join(SQL.identifier(column) for column in columns),
+            SQL(", ").join(select),
+            SQL.identifier(table),
+            source,
+            seed_id,
+        ))
+        return [row_id for row_id, in self.env.cr.fetchall()]
+
+    @api.model
+    def _generate_catalog(self, product_count, recipe_count, ingredient_count=None, lines_per_recipe=5):
+        """Create a synthetic catalog with SQL.
+
+        The first products become POS menu items with a recipe and a kit, the
+        next ``ingredient_count`` ones (5% of the catalog by default) the
+        ingredients; the rest are plain products.
+        """
+        cr = self.env.cr
+        seed = self.env['product.template'].create({
+            'name': 'Benchmark Product',
+            'type': 'consu',
+            'standard_price': 1.0,
+            'list_price': 4.0,
+        })
+        seed_bom = self.env['mrp.bom'].create({
+            'product_tmpl_id': seed.id,
+            'type': 'phantom',
+        })
+        self.env.flush_all()
+        template_ids = self._clone_rows('product_template', seed.id, count=product_count)
+        product_ids = self._clone_rows('product_product', seed.product_variant_id.id, overrides={
+            'product_tmpl_id': template_ids,
+        })
+
+        ingredient_count = ingredient_count or max(product_count // 20, 1)
+        menu_item_ids = product_ids[:recipe_count]
+        ingredient_ids = product_ids[recipe_count:recipe_count + ingredient_count] or product_ids
+        cr.execute("""
+            UPDATE product_template pt
+               SET available_in_pos = pp.id = ANY(%(menu_items)s),
+                   is_ingredient = pp.id = ANY(%(ingredients)s)
+              FROM product_product pp
+             WHERE pp.product_tmpl_id = pt.id
+               AND pp.id = ANY(%(products)s)
+        """, {'menu_items': menu_item_ids, 'ingredients': ingredient_ids, 'products': product_ids})
+        cr.execute("UPDATE product_product SET is_ingredient = id = ANY(%s) WHERE id = ANY(%s)",
+                   [ingredient_ids, product_ids])
+
+        cr.execute("""
+            INSERT INTO restaurant_recipe (name, product_id, product_tmpl_id, recipe_type, portion_size,
+                                           active, company_id, currency_id, margin_alert_state, write_date)
+                 SELECT 'Benchmark Recipe ' || pp.id, pp.id, pp.product_tmpl_id, 'dish', 1,
+                        TRUE, %s, %s, 'ok', now() AT TIME ZONE 'UTC' - make_interval(secs => pp.id)
+                   FROM product_product pp
+                  WHERE pp.id = ANY(%s)
+               ORDER BY pp.id
+              RETURNING id, product_id, product_tmpl_id
+        """, [self.env.company.id, self.env.company.currency_id.id, menu_item_ids])
+        recipe_ids, recipe_product_ids, recipe_template_ids = (zip(*cr.fetchall()) if menu_item_ids else ((), (), ()))
+        recipe_ids = list(recipe_ids)
+        cr.execute("""
+            INSERT INTO recipe_ingredient_line (recipe_id, product_id, quantity, uom_id, sequence, write_date)
+                 SELECT r.id, ingredient.id, 0.1 * n, %s, n,
+                        now() AT TIME ZONE 'UTC' - make_interval(secs => r.pos * %s + n)
+                   FROM unnest(%s::int[]) WITH ORDINALITY AS r(id, pos),
+                        generate_series(1, %s) AS n,
+                        LATERAL (SELECT (%s::int[])[1 + (r.pos * %s + n) %% %s] AS id) AS ingredient
+        """, [seed.uom_id.id, lines_per_recipe, recipe_ids, lines_per_recipe,
+              ingredient_ids, lines_per_recipe, len(ingredient_ids)])
+
+        if recipe_ids:
+            self._clone_rows('mrp_bom', seed_bom.id, overrides={
+                'product_tmpl_id': list(recipe_template_ids),
+                'product_id': list(recipe_product_ids),
+                'recipe_id': recipe_ids,
+                'code': [f'RECIPE-{recipe_id}' for recipe_id in recipe_ids],
+            })
+            cr.execute("""
+                UPDATE restaurant_recipe r
+                   SET bom_id = b.id
+                  FROM mrp_bom b
+                 WHERE b.recipe_id = r.id
+                   AND r.id = ANY(%s)
+            """, [recipe_ids])
+        return template_ids, product_ids, recipe_ids
+
+    @api.model
+    def _benchmark_upgrade(self, product_count=100000, recipe_count=1000):
+        """Time filling the stored computed columns through the ORM and through the hooks.
+
+        Both run on copies of the tables in a throwaway schema, put first in
+        the search path: the live tables are neither altered nor locked. The
+        synthetic catalog and the schema are rolled back with a savepoint.
+        """
+        cr = self.env.cr
+        timings = {'product_count': product_count, 'recipe_count': recipe_count}
+        with cr.savepoint(flush=False) as savepoint:
+            start = time.perf_counter()
+            self._generate_catalog(product_count, recipe_count)
+            self.env.flush_all()
+            timings['generate'] = time.perf_counter() - start
+
+            cr.execute("SELECT current_schema(), current_setting('search_path')")
+            schema, search_path = cr.fetchone()
+            cr.execute(SQL("CREATE SCHEMA %s", SQL.identifier(UPGRADE_SCHEMA)))
+            for table in UPGRADE_TABLES:
+                copy, source = SQL.identifier(UPGRADE_SCHEMA, table), SQL.identifier(schema, table)
+                cr.execute(SQL("CREATE TABLE %s (LIKE %s INCLUDING ALL)", copy, source))
+                cr.execute(SQL("INSERT INTO %s SELECT * FROM %s", copy, source))
+            # Local to the transaction, rolling back the savepoint restores it. The
+            # ORM and the sql tools now resolve the copied tables in the schema.
+            cr.execute("SELECT set_config('search_path', %s, true)", [f'{UPGRADE_SCHEMA}, {search_path}'])
+
+            # What the ORM does when it creates the columns itself
+            self.env.invalidate_all()
+            start = time.perf_counter()
+            for model_name, field_name in PRECREATED_FIELDS:
+                Model = self.env[model_name].with_context(active_test=False)
+                self.env.add_to_compute(Model._fields[field_name], Model.search([]))
+            self.env.flush_all()
+            timings['orm_recompute'] = time.perf_counter() - start
+
+            # What the install/upgrade hooks do instead, on the copies only
+            for model_name, field_name in PRECREATED_FIELDS:
+                cr.execute(SQL(
+                    "ALTER TABLE %s DROP COLUMN %s",
+                    SQL.identifier(UPGRADE_SCHEMA, self.env[model_name]._table),
+                    SQL.identifier(field_name),
+                ))
+            start = time.perf_counter()
+            _precreate_stored_columns(self.env)
+            timings['sql_fill'] = time.perf_counter() - start
+            savepoint.rollback()
+        self.env.invalidate_all()
+        _logger.info("Upgrade benchmark: %s", timings)
+        return timings
+
+    @api.model
+    def _get_plan_indexes(self, query):
+        """Names of the indexes used by the plan of an ORM query"""
+        self.env.cr.execute(SQL("EXPLAIN (FORMAT JSON) %s", query.select()))
+        indexes = set()
+        todo = [self.env.cr.fetchone()[0][0]['Plan']]
+        while todo:
+            node = todo.pop()
+            if 'Index Name' in node:
+                indexes.add(node['Index Name'])
+            todo.extend(node.get('Plans', []))
+        return indexes
+
+    @api.model
+    def _get_plan_checks(self, product_ids, recipe_ids):
+        """(name, ORM query, expected indexes) of the hot lookup paths, any expected index will do"""
+        Product = self.env['product.product']
+        Line = self.env['recipe.ingredient.line']
+        ingredient = Product.search([('id', 'in', product_ids), ('is_ingredient', '=', True)], limit=1)
+        checks = [
+            ('lines by ingredient', Line._search([('product_id', '=', ingredient.id)]),
+             {'recipe_ingredient_line__product_id_index'}),
+            ('lines by recipe', Line._search([('recipe_id', '=', recipe_ids[0])]),
+             {'recipe_ingredient_line__recipe_id_index'}),
+            ('bom by recipe', self.env['mrp.bom']._search([('recipe_id', '=', recipe_ids[0])]),
+             {'mrp_bom__recipe_id_index'}),
+            ('ingredients', Product._search([('is_ingredient', '=', True)]),
+             {'product_product_is_ingredient_idx'}),
+            ('pos menu items', self.env['product.template']._search([('available_in_pos', '=', True)]),
+             {'product_template_available_in_pos_idx'}),
+        ]
+        # Feed pages resume from the middle of the catalog, as the controller does
+        for model_name in ('restaurant.recipe', 'recipe.ingredient.line'):
+            Model = self.env[model_name]
+            table = SQL.identifier(Model._table)
+            self.env.cr.execute(SQL(
+                "SELECT write_date, id FROM %s ORDER BY write_date, id OFFSET (SELECT COUNT(*) / 2 FROM %s) LIMIT 1",
+                table, table))
+            since, after_id = self.env.cr.fetchone()
+            checks.append((
+                f'{Model._table} feed page',
+                Model._search(['|', ('write_date', '>', since),
+                               '&', ('write_date', '=', since), ('id', '>', after_id)],
+                              order='write_date, id', limit=1000),
+                {f'{Model._table}_write_date_id_idx'},
+            ))
+        if self.env.registry.has_trigram:
+            checks.append((
+                'ingredient autocomplete',
+                Product._search([('is_ingredient', '=', True)] + Product._get_ingredient_search_domain('Benchmark')),
+                {'product_product_ingredient_default_code_trgm_idx',
+                 'product_product_ingredient_barcode_trgm_idx',
+                 'product_template_ingredient_name_trgm_idx'},
+            ))
+        return checks
+
+    @api.model
+    def _check_query_plans(self, product_count=100000, recipe_count=2000):
+        """Check the hot lookup paths use their indexes on a large synthetic catalog.
+
+        Runs inside a savepoint that is rolled back. Returns one result per
+        check and raises when any plan does not use an expected index.
+        """
+        cr = self.env.cr
+        results = []
+        with cr.savepoint(flush=False) as savepoint:
+            _template_ids, product_ids, recipe_ids = self._generate_catalog(product_count, recipe_count)
+            for table in ('product_template', 'product_product', 'restaurant_recipe',
+                          'recipe_ingredient_line', 'mrp_bom'):
+                cr.execute(SQL("ANALYZE %s", SQL.identifier(table)))
+            self.env.invalidate_all()
+
+            for name, query, expected in self._get_plan_checks(product_ids, recipe_ids):
+                used = self._get_plan_indexes(query)
+                results.append({
+                    'check': name,
+                    'expected': sorted(expected),
+                    'used': sorted(used),
+                    'ok': bool(used & expected),
+                })
+            savepoint.rollback()
+        self.env.invalidate_all()
+
+        failed = [result['check'] for result in results if not result['ok']]
+        for result in results:
+            _logger.info("Query plan %s: %s", result['check'], 'ok' if result['ok'] else result['used'])
+        if failed:
+            raise AssertionError("Lookups not using their index: %s" % ', '.join(failed))
+        return results
+
+    @api.model
+    def _generate_benchmark_data(self, ingredients, recipes, lines, depth):
+        """Create ingredients and recipes through the ORM, sub-recipes nested ``depth`` levels deep.
+
+        Recipes are spread over ``depth + 1`` levels: each level below the top
+        makes components, used as one of the ingredients of the next level.
+        """
+        Template = self.env['product.template']
+        ingredient_products = Template.create([{
+            'name': f'Benchmark Ingredient {index}',
+            'type': 'consu',
+            'is_storable': True,
+            'is_ingredient': True,
+            'standard_price': 1.0 + index % 10,
+        } for index in range(ingredients)]).product_variant_ids
+
+        all_recipes = self.env['restaurant.recipe']
+        components = self.env['product.product']
+        for level in range(depth + 1):
+            is_dish = level == depth
+            count = recipes // (depth + 1) + (1 if level < recipes % (depth + 1) else 0)
+            products = Template.create([{
+                'name': f'Benchmark {"Dish" if is_dish else "Component"} {level}.{index}',
+                'type': 'consu',
+                'available_in_pos': is_dish,
+                'is_ingredient': not is_dish,
+                'list_price': 12.0,
+            } for index in range(count)]).product_variant_ids
+
+            vals_list = []
+            for index, product in enumerate(products):
+                line_products = [
+                    ingredient_products[(index * lines + position) % len(ingredient_products)]
+                    for position in range(lines - (1 if components else 0))
+                ]
+                if components:
+                    line_products.append(components[index % len(components)])
+                vals_list.append({
+                    'name': product.name,
+                    'product_id': product.id,
+                    'recipe_type': 'dish' if is_dish else 'component',
+                    'ingredient_line_ids': [Command.create({
+                        'product_id': line_product.id,
+                        'quantity': 0.1,
+                        'uom_id': line_product.uom_id.id,
+                    }) for line_product in line_products],
+                })
+            all_recipes |= self.env['restaurant.recipe'].create(vals_list)
+            components = products
+        return ingredient_products, all_recipes
+
+    @api.model
+    def _measure(self, operation, records, func):
+        """Run one operation from a cold cache, returning its timing and query count"""
+        cr = self.env.cr
+        self.env.flush_all()
+        self.env.invalidate_all()
+        queries = cr.sql_log_count
+        start = time.perf_counter()
+        func()
+        self.env.flush_all()
+        seconds = time.perf_counter() - start
+        return {
+            'operation': operation,
+            'records': records,
+            'seconds': round(seconds, 4),
+            'queries': cr.sql_log_count - queries,
+        }
+
+    @api.model
+    def _compare_sizes(self, small, large):
+        """Check the query count of one operation measured on n and on more records"""
+        added = large['records'] - small['records']
+        allowance = math.ceil(math.log2(max(large['records'] / max(small['records'], 1), 2)))
+        limit = small['queries'] + allowance + PER_RECORD_QUERIES.get(small['operation'], 0) * added
+        return {
+            'operation': small['operation'],
+            'records': [small['records'], large['records']],
+            'seconds': [small['seconds'], large['seconds']],
+            'queries': [small['queries'], large['queries']],
+            'query_limit': limit,
+            'within_budget': large['queries'] <= limit,
+        }
+
+    @api.model
+    def _get_stocktake_accounts(self):
+        Account = self.env['account.account']
+        company_domain = [('company_ids', 'in', self.env.company.id)]
+        gain = Account.search(company_domain + [('account_type', 'in', ('income', 'income_other'))], limit=1)
+        loss = Account.search(company_domain + [('account_type', '=', 'expense')], limit=1)
+        journal = self.env['account.journal'].search([
+            ('type', '=', 'general'),
+            ('company_id', '=', self.env.company.id),
+        ], limit=1)
+        return gain, loss, journal
+
+    @api.model
+    def _benchmark_operations(self, ingredients, recipes, lines, depth, stocktake_size):
+        """Measure the main operations on a synthetic catalog of the given size.
+
+        Returns (generation seconds, results); the catalog is left for the
+        caller to roll back.
+        """
+        results = []
+        start = time.perf_counter()
+        ingredient_products, all_recipes = self._generate_benchmark_data(ingredients, recipes, lines, depth)
+        self.env.flush_all()
+        generate_seconds = round(time.perf_counter() - start, 4)
+
+        results.append(self._measure(
+            'recalculate_costs', len(all_recipes), all_recipes.action_recalculate_costs))
+        results.append(self._measure(
+            'sync_bom_write', len(all_recipes), lambda: all_recipes.write({'portion_size': 2.0})))
+
+        dashboard = self.env['recipe.dashboard'].create({'name': 'Benchmark Dashboard'})
+        results.append(self._measure('dashboard_stats', len(all_recipes), dashboard._compute_stats))
+
+        stocktake = self.env['ingredient.stocktake'].create({})
+        results.append(self._measure(
+            'load_all_ingredients', len(ingredient_products), stocktake.action_load_all_ingredients))
+
+        counted = stocktake.line_ids[:stocktake_size]
+        (stocktake.line_ids - counted).unlink()
+        counted.write({'counted_qty': 5.0})
+        stocktake.action_start()
+        gain, loss, journal = self._get_stocktake_accounts()
+        if gain and loss and journal:
+            stocktake.write({'gain_account_id': gain.id, 'loss_account_id': loss.id})
+            results.append(self._measure('validate_stocktake', len(counted), stocktake.action_validate))
+
+        new_items = self.env['product.template'].create([{
+            'name': f'Benchmark Menu Item {index}',
+            'type': 'consu',
+            'available_in_pos': True,
+        } for index in range(recipes)]).product_variant_ids
+        results.append(self._measure('create_recipe_bulk', len(new_items), new_items.action_create_recipe_bulk))
+        return generate_seconds, results
+
+    @api.model
+    def _run_benchmarks(self, ingredients=50, recipes=20, lines=8, depth=2, stocktake_size=20):
+        """Time and query-count the main operations on n and ``QUERY_SCALE`` * n records.
+
+        Each size runs inside a savepoint that is rolled back. Returns a JSON
+        serializable report; ``passed`` is False when the query count of an
+        operation grew with the records.
+        """
+        cr = self.env.cr
+        report = {
+            'params': {
+                'ingredients': ingredients,
+                'recipes': recipes,
+                'lines': lines,
+                'depth': depth,
+                'stocktake_size': stocktake_size,
+                'scale': QUERY_SCALE,
+            },
+            'generate_seconds': [],
+            'results': [],
+        }
+        measured = []
+        for scale in (1, QUERY_SCALE):
+            with cr.savepoint(flush=False) as savepoint:
+                generate_seconds, results = self._benchmark_operations(
+                    ingredients * scale, recipes * scale, lines, depth, stocktake_size * scale)
+                savepoint.rollback()
+            self.env.invalidate_all()
+            report['generate_seconds'].append(generate_seconds)
+            measured.append({result['operation']: result for result in results})
+
+        small, large = measured
+        for operation, result in small.items():
+            if operation in large:
+                report['results'].append(self._compare_sizes(result, large[operation]))
+        if 'validate_stocktake' not in small:
+            report['results'].append({'operation': 'validate_stocktake', 'skipped': 'no chart of accounts'})
+
+        report['passed'] = all(result.get('within_budget', True) for result in report['results'])
+        for result in report['results']:
+            _logger.info("Benchmark %s: %s", result['operation'], result)
+        return report
+
+    @api.model
+    def _prepare_pos_load(self, recipes, ingredients, lines, depth):
+        """Create recipe-backed menu items and a POS config with an open session selling them.
+
+        The config is copied from the first one of the company, keeping only
+        its non-cash payment methods, which may be shared between shops.
+        Returns the session, the menu items and the payment method to use.
+        """
+        source = self.env['pos.config'].search([('company_id', '=', self.env.company.id)], limit=1)
+        payment_methods = source.payment_method_ids.filtered(lambda method: not method.is_cash_count)
+        if not payment_methods:
+            raise UserError(_('A point of sale with a non-cash payment method is needed to copy from.'))
+
+        _ingredients, all_recipes = self._generate_benchmark_data(ingredients, recipes, lines, depth)
+        config = source.copy({
+            'name': f'Recipe Load Test {fields.Datetime.now()}',
+            'payment_method_ids': [Command.set(payment_methods.ids)],
+        })
+        session = self.env['pos.session'].create({'config_id': config.id, 'user_id': self.env.uid})
+        session.set_opening_control(0, '')
+        menu_items = all_recipes.filtered(lambda recipe: recipe.recipe_type == 'dish').product_id
+        return session, menu_items, payment_methods[:1]
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, fields, models, _
+
+_logger = logging.getLogger(__name__)
+
+DRIFT_TYPES = [
+    ('no_bom', 'Missing BOM'),
+    ('header', 'BOM Header Differs'),
+    ('missing', 'Missing Kit Line'),
+    ('extra', 'Extra Kit Line'),
+    ('product', 'Different Ingredient'),
+    ('uom', 'Different UoM'),
+    ('quantity', 'Different Quantity'),
+    ('orphan', 'Orphan BOM'),
+]
+
+
+class RecipeBomDrift(models.Model):
+    _name = 'recipe.bom.drift'
+    _description = 'Recipe / BOM Drift'
+    _order = 'recipe_id, drift_type, product_id'
+    _log_access = False
+
+    check_date = fields.Datetime(string='Checked On', readonly=True)
+    recipe_id = fields.Many2one('restaurant.recipe', string='Recipe', index=True, ondelete='cascade')
+    bom_id = fields.Many2one('mrp.bom', string='BOM', ondelete='cascade')
+    drift_type = fields.Selection(DRIFT_TYPES, string='Drift', required=True)
+    product_id = fields.Many2one('product.product', string='Ingredient', ondelete='cascade')
+    recipe_line_id = fields.Many2one('recipe.ingredient.line', string='Recipe Line', ondelete='cascade')
+    bom_line_id = fields.Many2one('mrp.bom.line', string='Kit Line', ondelete='cascade')
+    recipe_qty = fields.Float(string='Recipe Qty', digits='Product Unit of Measure')
+    bom_qty = fields.Float(string='BOM Qty', digits='Product Unit of Measure')
+    recipe_uom_id = fields.Many2one('uom.uom', string='Recipe UoM')
+    bom_uom_id = fields.Many2one('uom.uom', string='BOM UoM')
+
+    def _query_line_drift(self, recipe_ids, precision):
+        """Compare recipe lines and kit lines of the recipe BOMs in one pass.
+
+        Recipe lines are paired with the kit line they generated; a pairing is
+        only kept when that kit line still belongs to the recipe BOM.
+        """
+        self.env.cr.execute("""
+            WITH rl AS (
+                SELECT l.id AS line_id, l.recipe_id, l.product_id, l.quantity, l.uom_id, bl.id AS bom_line_id
+                  FROM recipe_ingredient_line l
+                  JOIN restaurant_recipe r ON r.id = l.recipe_id
+             LEFT JOIN mrp_bom_line bl ON bl.id = l.bom_line_id AND bl.bom_id = r.bom_id
+                 WHERE r.active
+                   AND r.bom_id IS NOT NULL
+                   AND (%(all)s OR r.id = ANY(%(recipe_ids)s))
+            ), kl AS (
+                SELECT r.id AS recipe_id, bl.id AS bom_line_id, bl.bom_id, bl.product_id,
+                       bl.product_qty, bl.product_uom_id
+                  FROM mrp_bom_line bl
+                  JOIN restaurant_recipe r ON r.bom_id = bl.bom_id
+                 WHERE r.active
+                   AND (%(all)s OR r.id = ANY(%(recipe_ids)s))
+            )
+            SELECT COALESCE(rl.recipe_id, kl.recipe_id), kl.bom_id, rl.line_id, kl.bom_line_id,
+                   COALESCE(rl.product_id, kl.product_id), rl.quantity, kl.product_qty,
+                   rl.uom_id, kl.product_uom_id,
+                   CASE WHEN kl.bom_line_id IS NULL THEN 'missing'
+                        WHEN rl.line_id IS NULL THEN 'extra'
+                        WHEN rl.product_id != kl.product_id THEN 'product'
+                        WHEN rl.uom_id != kl.product_uom_id THEN 'uom'
+                        ELSE 'quantity'
+                   END
+              FROM rl
+         FULL JOIN kl ON kl.bom_line_id = rl.bom_line_id
+             WHERE rl.line_id IS NULL
+                OR kl.bom_line_id IS NULL
+                OR rl.product_id != kl.product_id
+                OR rl.uom_id != kl.product_uom_id
+                OR ROUND(rl.quantity::numeric, %(precision)s) != ROUND(kl.product_qty::numeric, %(precision)s)
+        """, {'all': recipe_ids is None, 'recipe_ids': recipe_ids or [], 'precision': precision})
+        return [{
+            'recipe_id': recipe_id,
+            'bom_id': bom_id,
+            'recipe_line_id': line_id,
+            'bom_line_id': bom_line_id,
+            'product_id': product_id,
+            'recipe_qty': recipe_qty or 0.0,
+            'bom_qty': bom_qty or 0.0,
+            'recipe_uom_id': recipe_uom_id,
+            'bom_uom_id': bom_uom_id,
+            'drift_type': drift_type,
+        } for (recipe_id, bom_id, line_id, bom_line_id, product_id, recipe_qty, bom_qty,
+               recipe_uom_id, bom_uom_id, drift_type) in self.env.cr.fetchall()]
+
+    def _query_header_drift(self, recipe_ids, precision):
+        """Recipes with ingredients but no usable kit, or a kit not matching the recipe"""
+        self.env.cr.execute("""
+            SELECT r.id, b.id,
+                   CASE WHEN b.id IS NULL OR NOT b.active THEN 'no_bom' ELSE 'header' END,
+                   COALESCE(NULLIF(r.portion_size, 0), 1), b.product_qty
+              FROM restaurant_recipe r
+         LEFT JOIN mrp_bom b ON b.id = r.bom_id
+             WHERE r.active
+               AND (%(all)s OR r.id = ANY(%(recipe_ids)s))
+               AND EXISTS (SELECT 1 FROM recipe_ingredient_line l WHERE l.recipe_id = r.id)
+               AND (b.id IS NULL
+                    OR NOT b.active
+                    OR b.type != 'phantom'
+                    OR b.product_id IS DISTINCT FROM r.product_id
+                    OR ROUND(b.product_qty::numeric, %(precision)s)
+                       != ROUND(COALESCE(NULLIF(r.portion_size, 0), 1)::numeric, %(precision)s))
+        """, {'all': recipe_ids is None, 'recipe_ids': recipe_ids or [], 'precision': precision})
+        return [{
+            'recipe_id': recipe_id,
+            'bom_id': bom_id,
+            'drift_type': drift_type,
+            'recipe_qty': portions,
+            'bom_qty': bom_qty or 0.0,
+        } for recipe_id, bom_id, drift_type, portions, bom_qty in self.env.cr.fetchall()]
+
+    def _query_orphan_boms(self):
+        """Active recipe kits no recipe points to anymore"""
+        self.env.cr.execute("""
+            SELECT b.id
+              FROM mrp_bom b
+             WHERE b.active
+               AND b.code LIKE 'RECIPE-%'
+               AND NOT EXISTS (SELECT 1 FROM restaurant_recipe r WHERE r.bom_id = b.id)
+        """)
+        return [{'bom_id': bom_id, 'drift_type': 'orphan'} for bom_id, in self.env.cr.fetchall()]
+
+    @api.model
+    def _check_drift(self, recipes=None):
+        """Rebuild the drift report, for all recipes or only the given ones"""
+        self.env.flush_all()
+        precision = self.env['decimal.precision'].precision_get('Product Unit of Measure')
+        recipe_ids = None if recipes is None else recipes.ids
+
+        if recipes is None:
+            self.search([]).unlink()
+        else:
+            self.search([('recipe_id', 'in', recipe_ids)]).unlink()
+
+        vals_list = self._query_header_drift(recipe_ids, precision)
+        vals_list += self._query_line_drift(recipe_ids, precision)
+        if recipes is None:
+            vals_list += self._query_orphan_boms()
+
+        now = fields.Datetime.now()
+        for vals in vals_list:
+            vals['check_date'] = now
+        return self.create(vals_list)
+
+    @api.model
+    def _cron_check_drift(self):
+        drifts = self._check_drift()
+        if drifts:
+            _logger.warning(
+                "Recipe/BOM drift: %d differences over %d recipes and %d orphan BOMs",
+                len(drifts), len(drifts.recipe_id),
+                len(drifts.filtered(lambda d: d.drift_type == 'orphan')),
+            )
+
+    def action_check(self):
+        self._check_drift()
+        return self.env['ir.actions.act_window']._for_xml_id('pos_recipe_costing.action_recipe_bom_drift')
+
+    def action_repair(self):
+        """Resync the drifted recipes only and archive the orphan kits"""
+        drifts = self or self.search([])
+        recipes = drifts.recipe_id.exists()
+        # The sync updates the recipe kit in place, an archived one must come back first
+        archived = drifts.filtered(lambda d: d.drift_type == 'no_bom').bom_id.exists().filtered(
+            lambda bom: not bom.active)
+        if archived:
+            archived.action_unarchive()
+        for recipe in recipes:
+            recipe._sync_bom()
+        orphan_drifts = drifts.filtered(lambda d: d.drift_type == 'orphan')
+        orphans = orphan_drifts.bom_id
+        if orphans:
+            orphans.action_archive()
+        orphan_drifts.unlink()
+        self._check_drift(recipes)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('BOM Repair'),
+                'message': _('%(recipes)s recipes resynced, %(boms)s orphan BOMs archived.',
+                             recipes=len(recipes), boms=len(orphans)),
+                'type': 'success',
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class RecipeConsumptionLine(models.Model):
+    _name = 'recipe.consumption.line'
+    _description = 'Recipe Theoretical Consumption'
+    _order = 'id desc'
+    _log_access = False
+
+    session_id = fields.Many2one('pos.session', string='Session', required=True, index=True, ondelete='cascade')
+    order_id = fields.Many2one('pos.order', string='Order', index=True, ondelete='cascade')
+    date = fields.Datetime(string='Date', default=fields.Datetime.now)
+    product_id = fields.Many2one('product.product', string='Ingredient', required=True, ondelete='cascade')
+    uom_id = fields.Many2one(related='product_id.uom_id', string='UoM')
+    quantity = fields.Float(string='Quantity', digits='Product Unit of Measure',
+                            help="Theoretical usage, negative for refunds")
+    location_id = fields.Many2one('stock.location', string='Source Location', required=True)
+    location_dest_id = fields.Many2one('stock.location', string='Destination Location', required=True)
+    posted = fields.Boolean(string='Posted', index=True)
+    move_id = fields.Many2one('stock.move', string='Stock Move', readonly=True)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+FULL_RESOLUTION_PARAM = 'pos_recipe_costing.cost_history_full_days'
+RETENTION_PARAM = 'pos_recipe_costing.cost_history_keep_months'
+
+# Days of history kept with every change, older changes are downsampled to month end
+DEFAULT_FULL_RESOLUTION_DAYS = 90
+
+
+class RecipeCostHistory(models.Model):
+    """Recipe costs over time, one row per transaction that changed them.
+
+    Rows are appended by a database trigger on restaurant_recipe, so that every
+    way the stored costs are written, recomputation or SQL, is recorded.
+    """
+    _name = 'recipe.cost.history'
+    _description = 'Recipe Cost History'
+    _order = 'recipe_id, date desc'
+    _log_access = False
+
+    recipe_id = fields.Many2one('restaurant.recipe', string='Recipe', required=True, readonly=True,
+                                ondelete='cascade')
+    date = fields.Datetime(string='Date', required=True, readonly=True)
+    total_cost = fields.Float(string='Total Recipe Cost', readonly=True)
+    cost_per_portion = fields.Float(string='Cost per Portion', readonly=True)
+    currency_id = fields.Many2one(related='recipe_id.currency_id')
+
+    _sql_constraints = [
+        # Also the (recipe, date) index of cost-at-date lookups and range charts
+        ('recipe_date_unique', 'unique(recipe_id, date)', 'A recipe has one cost per date.')
+    ]
+
+    def init(self):
+        cr = self.env.cr
+        cr.execute("""
+            CREATE OR REPLACE FUNCTION recipe_cost_history_log() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO recipe_cost_history (recipe_id, date, total_cost, cost_per_portion)
+                     VALUES (NEW.id, NOW() AT TIME ZONE 'UTC',
+                             COALESCE(NEW.total_cost, 0), COALESCE(NEW.cost_per_portion, 0))
+                ON CONFLICT (recipe_id, date) DO UPDATE
+                        SET total_cost = EXCLUDED.total_cost,
+                            cost_per_portion = EXCLUDED.cost_per_portion;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS recipe_cost_history_insert ON restaurant_recipe;
+            CREATE TRIGGER recipe_cost_history_insert
+                AFTER INSERT ON restaurant_recipe
+                FOR EACH ROW
+                WHEN (NEW.total_cost IS NOT NULL OR NEW.cost_per_portion IS NOT NULL)
+                EXECUTE FUNCTION recipe_cost_history_log();
+
+            DROP TRIGGER IF EXISTS recipe_cost_history_update ON restaurant_recipe;
+            CREATE TRIGGER recipe_cost_history_update
+                AFTER UPDATE OF total_cost, cost_per_portion ON restaurant_recipe
+                FOR EACH ROW
+                WHEN (OLD.total_cost IS DISTINCT FROM NEW.total_cost
+                      OR OLD.cost_per_portion IS DISTINCT FROM NEW.cost_per_portion)
+                EXECUTE FUNCTION recipe_cost_history_log();
+        """)
+        # Start the history of existing recipes from their current cost
+        cr.execute("""
+            INSERT INTO recipe_cost_history (recipe_id, date, total_cost, cost_per_portion)
+                 SELECT r.id, NOW() AT TIME ZONE 'UTC', COALESCE(r.total_cost, 0), COALESCE(r.cost_per_portion, 0)
+                   FROM restaurant_recipe r
+                  WHERE NOT EXISTS (SELECT 1 FROM recipe_cost_history h WHERE h.recipe_id = r.id)
+        """)
+
+    def _flush_recipe_costs(self):
+        self.env['restaurant.recipe'].flush_model(['total_cost', 'cost_per_portion'])
+
+    @api.model
+    def _get_cost_at(self, recipes, date):
+        """Return {recipe_id: (total cost, cost per portion)} of the given recipes at the given date"""
+        if not recipes:
+            return {}
+        self._flush_recipe_costs()
+        self.env.cr.execute("""
+            SELECT r.id, h.total_cost, h.cost_per_portion
+              FROM unnest(%s::int[]) AS r(id)
+              JOIN LATERAL (
+                    SELECT total_cost, cost_per_portion
+                      FROM recipe_cost_history
+                     WHERE recipe_id = r.id
+                       AND date <= %s
+                  ORDER BY date DESC
+                     LIMIT 1
+                   ) h ON TRUE
+        """, [recipes.ids, date])
+        return {recipe_id: (total_cost, cost_per_portion)
+                for recipe_id, total_cost, cost_per_portion in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_cost_series(self, recipes, date_from, date_to):
+        """Return {recipe_id: [(date, cost per portion)]} over the given period.
+
+        The series starts with the cost in effect at date_from, so that a chart
+        of the period begins at the right level.
+        """
+        if not recipes:
+            return {}
+        self._flush_recipe_costs()
+        self.env.cr.execute("""
+            SELECT r.id, h.date, h.cost_per_portion
+              FROM unnest(%(recipe_ids)s::int[]) AS r(id)
+              JOIN LATERAL (
+                    (SELECT %(date_from)s::timestamp AS date, cost_per_portion
+                       FROM recipe_cost_history
+                      WHERE recipe_id = r.id
+                        AND date <= %(date_from)s
+                   ORDER BY date DESC
+                      LIMIT 1)
+                    UNION ALL
+                    (SELECT date, cost_per_portion
+                       FROM recipe_cost_history
+                      WHERE recipe_id = r.id
+                        AND date > %(date_from)s
+                        AND date <= %(date_to)s
+                   ORDER BY date)
+                   ) h ON TRUE
+          ORDER BY r.id, h.date
+        """, {'recipe_ids': recipes.ids, 'date_from': date_from, 'date_to': date_to})
+        series = {recipe_id: [] for recipe_id in recipes.ids}
+        for recipe_id, date, cost in self.env.cr.fetchall():
+            series[recipe_id].append((date, cost))
+        return series
+
+    @api.model
+    def _cron_downsample(self):
+        """Apply the retention policy.
+
+        Past the full resolution period only the last cost of each month is
+        kept, and rows equal to the previous kept one are dropped. Past the
+        retention period, only the cost in effect at its start is kept.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        cr = self.env.cr
+        full_days = int(ICP.get_param(FULL_RESOLUTION_PARAM, DEFAULT_FULL_RESOLUTION_DAYS))
+        keep_months = int(ICP.get_param(RETENTION_PARAM, 0))
+        now = fields.Datetime.now()
+
+        cutoff = now - timedelta(days=full_days)
+        cr.execute("""
+            DELETE FROM recipe_cost_history
+             WHERE id IN (
+                SELECT id
+                  FROM (SELECT id,
+                               ROW_NUMBER() OVER (PARTITION BY recipe_id, date_trunc('month', date)
+                                                      ORDER BY date DESC) AS rank
+                          FROM recipe_cost_history
+                         WHERE date < %s) ranked
+                 WHERE rank > 1
+             )
+        """, [cutoff])
+        downsampled = cr.rowcount
+        cr.execute("""
+            DELETE FROM recipe_cost_history
+             WHERE id IN (
+                SELECT id
+                  FROM (SELECT id,
+                               total_cost = LAG(total_cost) OVER history
+                               AND cost_per_portion = LAG(cost_per_portion) OVER history AS unchanged
+                          FROM recipe_cost_history
+                         WHERE date < %s
+                        WINDOW history AS (PARTITION BY recipe_id ORDER BY date)) ordered
+                 WHERE unchanged
+             )
+        """, [cutoff])
+        downsampled += cr.rowcount
+
+        expired = 0
+        if keep_months:
+            limit = now - relativedelta(months=keep_months)
+            cr.execute("""
+                DELETE FROM recipe_cost_history h
+                 WHERE h.date < %(limit)s
+                   AND EXISTS (SELECT 1
+                                 FROM recipe_cost_history later
+                                WHERE later.recipe_id = h.recipe_id
+                                  AND later.date > h.date
+                                  AND later.date <= %(limit)s)
+            """, {'limit': limit})
+            expired = cr.rowcount
+        if downsampled or expired:
+            _logger.info("Recipe cost history: %d rows downsampled, %d rows expired", downsampled, expired)
+            self.invalidate_model()
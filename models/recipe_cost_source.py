@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+COST_SOURCES = [
+    ('standard', 'Standard Cost'),
+    ('last_purchase', 'Last Purchase Price'),
+    ('supplier', 'Best Vendor Price'),
+    ('average', 'Rolling Average Receipt Price'),
+]
+
+# Sources priced from the vendor receipts, and those whose prices move with the date alone
+RECEIPT_SOURCES = {'last_purchase', 'average'}
+DATED_SOURCES = {'average', 'supplier'}
+
+# Exchange rates fetched by the current transaction, by (currency, company, date)
+RATE_CACHE_KEY = 'pos_recipe_costing.currency_rates'
+
+
+class RecipeCostSource(models.AbstractModel):
+    """Ingredient prices of recipe costing, resolved for a whole set of products at once.
+
+    Every source returns {product_id: price per stock UoM in company currency}
+    through a ``_get_prices_<source>`` method, so that modules can add their
+    own sources by extending ``res.company.recipe_cost_source`` and this model.
+    Products a source has no price for are costed at their standard cost.
+    """
+    _name = 'recipe.cost.source'
+    _description = 'Recipe Cost Source'
+
+    @api.model
+    def _get_prices(self, products, company=None, quantities=None):
+        """Return {product_id: unit price} of the given products with the company's cost source.
+
+        ``quantities`` optionally gives {product_id: quantity bought}, for the
+        sources with quantity breaks.
+        """
+        company = company or self.env.company
+        products = products.with_company(company)
+        if not products:
+            return {}
+        source = company.recipe_cost_source or 'standard'
+        prices = {}
+        if source != 'standard':
+            prices = getattr(self, f'_get_prices_{source}')(products, company, quantities or {})
+        missing = products.filtered(lambda product: product.id not in prices)
+        if missing:
+            prices.update(self._get_prices_standard(missing, company, quantities or {}))
+        return prices
+
+    @api.model
+    def _get_companies_using(self, sources):
+        """Companies costing their recipes with one of the given sources"""
+        return self.env['res.company'].sudo().search([('recipe_cost_source', 'in', list(sources))])
+
+    @api.model
+    def _recompute_costs(self, products=None, companies=None):
+        """Recost the recipe lines of ``companies`` using ``products``, None meaning all.
+
+        The prices of the sources do not live in fields the line costs could
+        depend on, so the sources call this when their prices move.
+        """
+        if (products is not None and not products) or (companies is not None and not companies):
+            return
+        domain = []
+        if products is not None:
+            domain.append(('product_id', 'in', products.ids))
+        if companies is not None:
+            domain.append(('recipe_id.company_id', 'in', companies.ids))
+        lines = self.env['recipe.ingredient.line'].sudo().with_context(active_test=False).search(domain)
+        self._recompute_line_costs(lines)
+
+    @api.model
+    def _recompute_line_costs(self, lines):
+        if lines:
+            lines.invalidate_recordset(['unit_cost'])
+            lines.modified(['unit_cost'])
+        self.env['recipe.costing.catalog']._invalidate_catalog()
+
+    @api.model
+    def _recompute_rates(self, companies=None):
+        """Recost what depends on the exchange rates of ``companies``, None meaning all.
+
+        That is the recipes in another currency than their company's, and the
+        vendor prices of the companies using the supplier source.
+        """
+        self.env.cr.postcommit.data.pop(RATE_CACHE_KEY, None)
+        domain = [('currency_id', '!=', False)]
+        if companies is not None:
+            domain.append(('company_id', 'in', companies.ids))
+        recipes = self.env['restaurant.recipe'].sudo().with_context(active_test=False).search(domain).filtered(
+            lambda recipe: recipe.currency_id != recipe.company_id.currency_id)
+        if recipes:
+            recipes.invalidate_recordset(['selling_price'])
+            recipes.modified(['selling_price'])
+        self._recompute_line_costs(recipes.ingredient_line_ids)
+        suppliers = self._get_companies_using({'supplier'})
+        if companies is not None:
+            suppliers &= companies
+        self._recompute_costs(companies=suppliers)
+
+    @api.model
+    def _cron_recompute_costs(self):
+        """Recost the recipes whose prices or exchange rates move with the date alone"""
+        self._recompute_costs(companies=self._get_companies_using(DATED_SOURCES))
+        Company = self.env['res.company'].sudo()
+        self._recompute_rates(Company.search([('recipe_rate_date_type', '!=', 'fixed')]))
+
+    @api.model
+    def _get_currency_rates(self, currencies, company, date):
+        """Return {currency_id: rate against the company currency}, looked up once per transaction"""
+        # Dropped on commit and rollback, so rates never outlive the request
+        cache = self.env.cr.postcommit.data.setdefault(RATE_CACHE_KEY, {})
+        missing = currencies.filtered(lambda currency: (currency.id, company.id, date) not in cache)
+        if missing:
+            for currency_id, rate in missing._get_rates(company, date).items():
+                cache[currency_id, company.id, date] = rate
+        return {currency.id: cache.get((currency.id, company.id, date)) for currency in currencies}
+
+    @api.model
+    def _get_conversion_rate(self, from_currency, to_currency, company, date):
+        """Cached equivalent of ``res.currency._get_conversion_rate``"""
+        if from_currency == to_currency:
+            return 1.0
+        rates = self._get_currency_rates(from_currency | to_currency, company, date)
+        missing = [currency.name for currency in from_currency | to_currency if not rates.get(currency.id)]
+        if missing:
+            raise UserError(_('No exchange rate of %(currencies)s on %(date)s for %(company)s.',
+                              currencies=', '.join(missing), date=date, company=company.name))
+        return rates[to_currency.id] / rates[from_currency.id]
+
+    @api.model
+    def _get_prices_standard(self, products, company, quantities):
+        return {product.id: product.standard_price for product in products.with_company(company)}
+
+    @api.model
+    def _get_prices_last_purchase(self, products, company, quantities):
+        """Price of the last receipt from a vendor"""
+        self.env['stock.move'].flush_model(['product_id', 'price_unit', 'state', 'date', 'location_id', 'company_id'])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (m.product_id) m.product_id, m.price_unit
+              FROM stock_move m
+              JOIN stock_location src ON src.id = m.location_id
+             WHERE m.product_id = ANY(%s)
+               AND m.company_id = %s
+               AND m.state = 'done'
+               AND src.usage = 'supplier'
+          ORDER BY m.product_id, m.date DESC, m.id DESC
+        """, [products.ids, company.id])
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _get_prices_average(self, products, company, quantities):
+        """Quantity weighted price of the vendor receipts of the company's averaging period"""
+        self.env['stock.move'].flush_model(
+            ['product_id', 'price_unit', 'product_qty', 'state', 'date', 'location_id', 'company_id'])
+        date_from = fields.Datetime.now() - timedelta(days=company.recipe_cost_average_days or 90)
+        self.env.cr.execute("""
+            SELECT m.product_id, SUM(m.price_unit * m.product_qty) / SUM(m.product_qty)
+              FROM stock_move m
+              JOIN stock_location src ON src.id = m.location_id
+             WHERE m.product_id = ANY(%s)
+               AND m.company_id = %s
+               AND m.state = 'done'
+               AND src.usage = 'supplier'
+               AND m.date >= %s
+               AND m.product_qty > 0
+          GROUP BY m.product_id
+        """, [products.ids, company.id, date_from])
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _get_prices_supplier(self, products, company, quantities):
+        """Cheapest vendor price valid today.
+
+        Only the vendor lines whose minimum quantity is reached by the quantity
+        bought count; without a quantity, those with the lowest minimum.
+        """
+        self.env['product.supplierinfo'].flush_model()
+        today = fields.Date.context_today(self)
+        self.env.cr.execute("""
+            SELECT pp.id, si.currency_id,
+                   si.price * (1 - COALESCE(si.discount, 0) / 100) * po_uom.factor / uom.factor,
+                   si.min_qty / po_uom.factor * uom.factor
+              FROM product_product pp
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+              JOIN uom_uom uom ON uom.id = pt.uom_id
+              JOIN uom_uom po_uom ON po_uom.id = pt.uom_po_id
+              JOIN product_supplierinfo si
+                ON si.product_tmpl_id = pt.id
+               AND (si.product_id IS NULL OR si.product_id = pp.id)
+             WHERE pp.id = ANY(%(product_ids)s)
+               AND (si.company_id IS NULL OR si.company_id = %(company_id)s)
+               AND (si.date_start IS NULL OR si.date_start <= %(today)s)
+               AND (si.date_end IS NULL OR si.date_end >= %(today)s)
+        """, {'product_ids': products.ids, 'company_id': company.id, 'today': today})
+
+        Currency = self.env['res.currency']
+        candidates = defaultdict(list)
+        for product_id, currency_id, price, min_qty in self.env.cr.fetchall():
+            price *= self._get_conversion_rate(Currency.browse(currency_id), company.currency_id, company, today)
+            candidates[product_id].append((min_qty, price))
+
+        prices = {}
+        for product_id, lines in candidates.items():
+            quantity = quantities.get(product_id)
+            if quantity is None:
+                quantity = min(min_qty for min_qty, _price in lines)
+            reachable = [price for min_qty, price in lines if min_qty <= quantity]
+            if reachable:
+                prices[product_id] = min(reachable)
+        return prices
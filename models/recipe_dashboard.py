@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 
+from .recipe_perf_sample import instrument
+
 
 class RecipeDashboard(models.Model):
     _name = 'recipe.dashboard'
@@ -32,6 +34,7 @@ class RecipeDashboard(models.Model):
     avg_food_cost = fields.Float(compute='_compute_stats')
     low_margin_count = fields.Integer(compute='_compute_stats')
 
+    @instrument('dashboard.compute_stats')
     def _compute_stats(self):
         Recipe = self.env['restaurant.recipe']
         Product = self.env['product.product']
@@ -153,13 +156,22 @@ class RecipeDashboard(models.Model):
             'context': {'module': 'pos_recipe_costing'},
         }
 
+    def action_view_performance(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Performance'),
+            'res_model': 'recipe.perf.stats',
+            'view_mode': 'list',
+            'target': 'current',
+        }
+
     def action_view_boms(self):
         return {
             'type': 'ir.actions.act_window',
             'name': _('Recipe BOMs'),
             'res_model': 'mrp.bom',
             'view_mode': 'list,form',
-            'domain': [('code', 'like', 'RECIPE-')],
+            'domain': [('recipe_id', '!=', False)],
             'target': 'current',
         }
 
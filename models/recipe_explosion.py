@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class RecipeExplosionLine(models.Model):
+    _name = 'recipe.explosion.line'
+    _description = 'Recipe Ingredient Explosion'
+    _order = 'recipe_id, product_id'
+    _log_access = False
+
+    recipe_id = fields.Many2one(
+        'restaurant.recipe',
+        string='Recipe',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    product_id = fields.Many2one(
+        'product.product',
+        string='Ingredient',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    bom_line_id = fields.Many2one(
+        'mrp.bom.line',
+        string='BOM Line',
+        ondelete='set null',
+        help="Kit line of the leaf recipe this quantity comes from"
+    )
+    uom_id = fields.Many2one(related='product_id.uom_id', string='UoM')
+    quantity = fields.Float(
+        string='Qty per Unit',
+        digits='Product Unit of Measure',
+        help="Quantity of this ingredient, in its stock unit of measure, "
+             "consumed for one unit of the menu item (sub-recipes included)"
+    )
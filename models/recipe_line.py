@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models
+from odoo.tools.sql import create_index
+
+from .recipe_perf_sample import instrument
 
 
 class RecipeIngredientLine(models.Model):
@@ -11,6 +14,7 @@ class RecipeIngredientLine(models.Model):
         'restaurant.recipe',
         string='Recipe',
         required=True,
+        index=True,
         ondelete='cascade'
     )
     sequence = fields.Integer(string='Sequence', default=10)
@@ -20,7 +24,9 @@ class RecipeIngredientLine(models.Model):
         'product.product',
         string='Ingredient',
         required=True,
-        domain="[('is_ingredient', '=', True)]"
+        index=True,
+        domain="[('is_ingredient', '=', True)]",
+        context={'recipe_ingredient_search': True}
     )
 
     # Quantity and UoM
@@ -31,12 +37,22 @@ class RecipeIngredientLine(models.Model):
         required=True
     )
 
+    # Generated kit line
+    bom_line_id = fields.Many2one(
+        'mrp.bom.line',
+        string='BOM Line',
+        readonly=True,
+        copy=False,
+        ondelete='set null'
+    )
+
     # Cost fields
     unit_cost = fields.Float(
         string='Unit Cost',
-        related='product_id.standard_price',
-        readonly=True
+        compute='_compute_unit_cost',
+        digits='Product Price'
     )
+    company_id = fields.Many2one(related='recipe_id.company_id')
     currency_id = fields.Many2one(
         related='recipe_id.currency_id',
         depends=['recipe_id.currency_id']
@@ -54,7 +70,39 @@ class RecipeIngredientLine(models.Model):
         readonly=True
     )
 
+    def init(self):
+        # Keyset order of the costing feed
+        create_index(self.env.cr, 'recipe_ingredient_line_write_date_id_idx', self._table, ['write_date', 'id'])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env['recipe.costing.catalog']._invalidate_catalog()
+        return lines
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['recipe.costing.catalog']._invalidate_catalog()
+        return res
+
+    def unlink(self):
+        self.env['recipe.costing.catalog']._invalidate_catalog()
+        return super().unlink()
+
+    @api.depends('product_id', 'product_id.standard_price', 'recipe_id.company_id', 'recipe_id.currency_id')
+    def _compute_unit_cost(self):
+        # One resolution per company, with the cost source of the recipe's company
+        CostSource = self.env['recipe.cost.source']
+        for company, lines in self.grouped(lambda line: line.company_id or self.env.company).items():
+            prices = CostSource._get_prices(lines.product_id, company)
+            rate_date = company._get_recipe_rate_date()
+            for line in lines:
+                currency = line.currency_id or company.currency_id
+                rate = CostSource._get_conversion_rate(company.currency_id, currency, company, rate_date)
+                line.unit_cost = prices.get(line.product_id.id, 0.0) * rate
+
     @api.depends('quantity', 'unit_cost', 'product_id.standard_price')
+    @instrument('recipe_line.compute_cost')
     def _compute_cost(self):
         for line in self:
             line.cost = line.quantity * line.unit_cost
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import functools
+import time
+
+from odoo import api, fields, models, tools
+
+INSTRUMENTATION_PARAM = 'pos_recipe_costing.instrumentation'
+SAMPLE_SLOT_SEQUENCE = 'recipe_perf_sample_slot_seq'
+
+# Samples kept, older ones are overwritten
+RING_SIZE = 10000
+
+
+def instrument(operation):
+    """Record wall time, SQL queries and records of each call, when instrumentation is on"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            Sample = self.env['recipe.perf.sample']
+            if not Sample._is_enabled():
+                return method(self, *args, **kwargs)
+            cr = self.env.cr
+            queries = cr.sql_log_count
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            Sample._record(operation, time.perf_counter() - start, cr.sql_log_count - queries, len(self))
+            return result
+        return wrapper
+    return decorator
+
+
+class RecipePerfSample(models.Model):
+    _name = 'recipe.perf.sample'
+    _description = 'Recipe Costing Performance Sample'
+    _order = 'date desc'
+    _log_access = False
+
+    slot = fields.Integer(string='Slot', required=True, readonly=True)
+    operation = fields.Char(string='Operation', required=True, index=True, readonly=True)
+    date = fields.Datetime(string='Date', readonly=True)
+    duration_ms = fields.Float(string='Duration (ms)', readonly=True)
+    query_count = fields.Integer(string='Queries', readonly=True)
+    record_count = fields.Integer(string='Records', readonly=True)
+    user_id = fields.Many2one('res.users', string='User', readonly=True)
+
+    _sql_constraints = [
+        ('slot_unique', 'unique(slot)', 'A ring buffer slot holds one sample.')
+    ]
+
+    def init(self):
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {SAMPLE_SLOT_SEQUENCE}")
+
+    @api.model
+    @tools.ormcache()
+    def _is_enabled(self):
+        # Cleared with the registry cache whenever a system parameter changes
+        return bool(self.env['ir.config_parameter'].sudo().get_param(INSTRUMENTATION_PARAM))
+
+    @api.model
+    def _record(self, operation, seconds, queries, records):
+        """Write a sample into the next slot of the ring buffer"""
+        self.env.cr.execute(f"""
+            INSERT INTO recipe_perf_sample (slot, operation, date, duration_ms, query_count, record_count, user_id)
+                 VALUES (nextval('{SAMPLE_SLOT_SEQUENCE}') %% %s, %s, NOW() AT TIME ZONE 'UTC', %s, %s, %s, %s)
+            ON CONFLICT (slot) DO UPDATE
+                    SET operation = EXCLUDED.operation,
+                        date = EXCLUDED.date,
+                        duration_ms = EXCLUDED.duration_ms,
+                        query_count = EXCLUDED.query_count,
+                        record_count = EXCLUDED.record_count,
+                        user_id = EXCLUDED.user_id
+        """, [RING_SIZE, operation, seconds * 1000, queries, records, self.env.uid])
+
+
+class RecipePerfStats(models.Model):
+    _name = 'recipe.perf.stats'
+    _description = 'Recipe Costing Performance Statistics'
+    _auto = False
+    _order = 'p95_ms desc'
+    _rec_name = 'operation'
+
+    operation = fields.Char(string='Operation', readonly=True)
+    sample_count = fields.Integer(string='Calls', readonly=True)
+    avg_ms = fields.Float(string='Average (ms)', readonly=True)
+    p50_ms = fields.Float(string='p50 (ms)', readonly=True)
+    p95_ms = fields.Float(string='p95 (ms)', readonly=True)
+    p99_ms = fields.Float(string='p99 (ms)', readonly=True)
+    max_ms = fields.Float(string='Max (ms)', readonly=True)
+    avg_queries = fields.Float(string='Avg Queries', readonly=True)
+    max_queries = fields.Integer(string='Max Queries', readonly=True)
+    avg_records = fields.Float(string='Avg Records', readonly=True)
+    last_date = fields.Datetime(string='Last Call', readonly=True)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT ROW_NUMBER() OVER (ORDER BY operation) AS id,
+                       operation,
+                       COUNT(*) AS sample_count,
+                       AVG(duration_ms) AS avg_ms,
+                       PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY duration_ms) AS p50_ms,
+                       PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+                       PERCENTILE_CONT(0.99) WITHIN GROUP (ORDER BY duration_ms) AS p99_ms,
+                       MAX(duration_ms) AS max_ms,
+                       AVG(query_count) AS avg_queries,
+                       MAX(query_count) AS max_queries,
+                       AVG(record_count) AS avg_records,
+                       MAX(date) AS last_date
+                  FROM recipe_perf_sample
+              GROUP BY operation
+            )
+        """)
+
+    def action_view_samples(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('pos_recipe_costing.action_recipe_perf_sample')
+        action['domain'] = [('operation', '=', self.operation)]
+        return action
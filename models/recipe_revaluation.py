@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models, Command, _
+from odoo.service.model import retrying
+
+_logger = logging.getLogger(__name__)
+
+# Biggest cost changes listed in the summary
+SUMMARY_TOP_CHANGES = 20
+
+
+class RecipeRevaluationRun(models.Model):
+    _name = 'recipe.revaluation.run'
+    _description = 'Recipe Revaluation Run'
+    _order = 'id desc'
+
+    name = fields.Char(string='Name', required=True)
+    shard_mode = fields.Selection([
+        ('range', 'Id Ranges'),
+        ('level', 'Sub-Recipe Levels'),
+    ], string='Sharding', required=True, default='level')
+    state = fields.Selection([
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ], string='Status', required=True, default='running')
+    shard_ids = fields.One2many('recipe.revaluation.shard', 'run_id', string='Shards')
+    date_done = fields.Datetime(string='Finished On', readonly=True)
+
+    @api.model
+    def _get_recipe_levels(self):
+        """Return {recipe_id: level} of the active recipes.
+
+        Recipes without sub-recipes are level 0, and every other recipe is one
+        level above its deepest sub-recipe, so that a level only depends on the
+        levels below it. Recipes in a cycle get the level above all others.
+        """
+        self.env.flush_all()
+        self.env.cr.execute("SELECT id FROM restaurant_recipe WHERE active")
+        recipe_ids = [recipe_id for recipe_id, in self.env.cr.fetchall()]
+        self.env.cr.execute("""
+            SELECT DISTINCT l.recipe_id, sub.id
+              FROM recipe_ingredient_line l
+              JOIN restaurant_recipe r ON r.id = l.recipe_id
+              JOIN restaurant_recipe sub ON sub.product_id = l.product_id
+             WHERE r.active
+               AND sub.active
+               AND sub.id != l.recipe_id
+        """)
+        sub_recipes = defaultdict(set)
+        for recipe_id, sub_recipe_id in self.env.cr.fetchall():
+            sub_recipes[recipe_id].add(sub_recipe_id)
+
+        levels = {}
+        todo = set(recipe_ids)
+        level = 0
+        while todo:
+            ready = {recipe_id for recipe_id in todo if not (sub_recipes[recipe_id] & todo)}
+            if not ready:
+                _logger.warning("Recipe revaluation: %d recipes use each other as sub-recipes", len(todo))
+                ready = todo
+            levels.update(dict.fromkeys(ready, level))
+            todo -= ready
+            level += 1
+        return levels
+
+    @api.model
+    def _create_run(self, shard_mode='level', shard_size=200):
+        """Split the active recipes into shards of consecutive ids, per level when sharding by level"""
+        if shard_mode == 'level':
+            levels = self._get_recipe_levels()
+        else:
+            self.env.cr.execute("SELECT id FROM restaurant_recipe WHERE active")
+            levels = dict.fromkeys((recipe_id for recipe_id, in self.env.cr.fetchall()), 0)
+        recipes_by_level = defaultdict(list)
+        for recipe_id, level in levels.items():
+            recipes_by_level[level].append(recipe_id)
+
+        shard_vals = []
+        for level, recipe_ids in sorted(recipes_by_level.items()):
+            recipe_ids.sort()
+            for start in range(0, len(recipe_ids), shard_size):
+                ids = recipe_ids[start:start + shard_size]
+                shard_vals.append({
+                    'level': level,
+                    'first_recipe_id': ids[0],
+                    'last_recipe_id': ids[-1],
+                    'recipe_ids': ids,
+                    'recipe_count': len(ids),
+                })
+        return self.create({
+            'name': _('Revaluation %s', fields.Datetime.now()),
+            'shard_mode': shard_mode,
+            'shard_ids': [Command.create(vals) for vals in shard_vals],
+        })
+
+    def _get_pending_levels(self):
+        """Return the levels of this run still to process, lowest first, with their pending shards"""
+        self.ensure_one()
+        pending = self.shard_ids.filtered(lambda shard: shard.state != 'done')
+        return [
+            (level, pending.filtered(lambda shard: shard.level == level))
+            for level in sorted(set(pending.mapped('level')))
+        ]
+
+    def _get_summary(self):
+        """Aggregate the cost changes recorded by the shards"""
+        self.ensure_one()
+        changes = [
+            {'recipe_id': int(recipe_id), 'old_cost': old_cost, 'new_cost': new_cost}
+            for shard in self.shard_ids
+            for recipe_id, (old_cost, new_cost) in (shard.changes or {}).items()
+        ]
+        recipe_names = {
+            recipe.id: recipe.display_name
+            for recipe in self.env['restaurant.recipe'].browse(
+                [change['recipe_id'] for change in changes]
+            ).exists()
+        }
+        for change in changes:
+            change['recipe'] = recipe_names.get(change['recipe_id'])
+            change['delta'] = change['new_cost'] - change['old_cost']
+        changes.sort(key=lambda change: abs(change['delta']), reverse=True)
+        shards = self.shard_ids
+        return {
+            'run_id': self.id,
+            'state': self.state,
+            'shard_mode': self.shard_mode,
+            'shards': len(shards),
+            'shards_done': len(shards.filtered(lambda shard: shard.state == 'done')),
+            'levels': len(set(shards.mapped('level'))),
+            'recipes': sum(shards.mapped('recipe_count')),
+            'recipes_revalued': sum(shards.mapped('done_count')),
+            'recipes_changed': len(changes),
+            'cost_increases': sum(1 for change in changes if change['delta'] > 0),
+            'cost_decreases': sum(1 for change in changes if change['delta'] < 0),
+            'total_delta': sum(change['delta'] for change in changes),
+            'largest_changes': changes[:SUMMARY_TOP_CHANGES],
+        }
+
+
+class RecipeRevaluationShard(models.Model):
+    _name = 'recipe.revaluation.shard'
+    _description = 'Recipe Revaluation Shard'
+    _order = 'run_id, level, first_recipe_id'
+
+    run_id = fields.Many2one('recipe.revaluation.run', string='Run', required=True, index=True, ondelete='cascade')
+    level = fields.Integer(string='Level', readonly=True)
+    first_recipe_id = fields.Integer(string='First Recipe Id', readonly=True)
+    last_recipe_id = fields.Integer(string='Last Recipe Id', readonly=True)
+    recipe_ids = fields.Json(string='Recipes', readonly=True)
+    recipe_count = fields.Integer(string='Recipe Count', readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ], string='Status', required=True, default='pending')
+    checkpoint_recipe_id = fields.Integer(
+        string='Checkpoint',
+        readonly=True,
+        help="Last recipe id committed, processing resumes after it"
+    )
+    done_count = fields.Integer(string='Revalued', readonly=True)
+    changes = fields.Json(string='Cost Changes', readonly=True, help="{recipe_id: [old cost, new cost]}")
+
+    def _revalue_chunk(self, recipes):
+        """Resync the kits, recompute the costs and push them to the products of the given recipes"""
+        old_costs = {recipe.id: recipe.cost_per_portion for recipe in recipes}
+        for recipe in recipes.sorted('id'):
+            recipe._sync_bom()
+        recipes.action_recalculate_costs()
+        recipes.action_update_product_cost()
+        self.env.flush_all()
+        currency = self.env.company.currency_id
+        return {
+            str(recipe.id): [old_costs[recipe.id], recipe.cost_per_portion]
+            for recipe in recipes
+            if currency.compare_amounts(old_costs[recipe.id], recipe.cost_per_portion)
+        }
+
+    def _process(self, chunk_size=50):
+        """Revalue the recipes of this shard after its checkpoint, committing every chunk"""
+        self.ensure_one()
+        cr = self.env.cr
+        Recipe = self.env['restaurant.recipe']
+        todo = [recipe_id for recipe_id in self.recipe_ids if recipe_id > self.checkpoint_recipe_id]
+        self.state = 'running'
+        cr.commit()
+        for start in range(0, len(todo), chunk_size):
+            chunk_ids = todo[start:start + chunk_size]
+
+            def revalue():
+                recipes = Recipe.browse(chunk_ids).exists()
+                changes = self._revalue_chunk(recipes)
+                self.write({
+                    'checkpoint_recipe_id': chunk_ids[-1],
+                    'done_count': self.done_count + len(recipes),
+                    'changes': dict(self.changes or {}, **changes),
+                })
+
+            # Shards of a level share parent recipes, retry on their concurrent updates
+            retrying(revalue, self.env)
+            cr.commit()
+        self.state = 'done'
+        cr.commit()
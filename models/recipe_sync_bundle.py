@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+import gzip
+import hashlib
+import json
+import logging
+import uuid
+
+from odoo import api, fields, models, Command, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 'pos_recipe_costing.bundle'
+BUNDLE_VERSION = 2
+
+# Id of the last bundle fully applied, the base the next delta must be exported from
+LAST_IMPORT_PARAM = 'pos_recipe_costing.bundle_last_import'
+
+# Export snapshots kept as possible bases of the next delta
+EXPORT_SNAPSHOTS_KEPT = 50
+
+# Recipe fields carried by the bundles
+BUNDLE_RECIPE_FIELDS = ['name', 'recipe_type', 'portion_size', 'prep_time', 'cook_time', 'instructions']
+
+
+def _product_key(product):
+    """Reference of a product across databases, or None when it has neither reference nor barcode"""
+    if product.default_code:
+        return f'default_code:{product.default_code}'
+    if product.barcode:
+        return f'barcode:{product.barcode}'
+    return None
+
+
+def _uom_key(reference):
+    """Hashable form of a UoM reference, ratios compared on 8 significant digits"""
+    return reference['xmlid'], reference['category'], f"{reference['factor']:.8g}"
+
+
+def _content_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class RecipeSyncExport(models.Model):
+    """Content hash of every recipe at an export, the base of later deltas"""
+    _name = 'recipe.sync.export'
+    _description = 'Recipe Bundle Export'
+    _order = 'id desc'
+
+    bundle_uuid = fields.Char(string='Bundle', required=True, readonly=True, index=True)
+    hashes = fields.Json(string='Recipe Hashes', readonly=True, help="{recipe_key: content hash}")
+
+    _sql_constraints = [
+        ('bundle_uuid_unique', 'unique(bundle_uuid)', 'A bundle is exported once.')
+    ]
+
+
+class RecipeSyncHash(models.Model):
+    """Content hash of each recipe at its last import"""
+    _name = 'recipe.sync.hash'
+    _description = 'Recipe Bundle Hash'
+    _log_access = False
+
+    recipe_key = fields.Char(string='Recipe Key', required=True)
+    content_hash = fields.Char(string='Content Hash', required=True)
+
+    _sql_constraints = [
+        ('recipe_key_unique', 'unique(recipe_key)', 'A recipe has one hash.')
+    ]
+
+    @api.model
+    def _get_hashes(self):
+        self.env.cr.execute("SELECT recipe_key, content_hash FROM recipe_sync_hash")
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _set_hashes(self, hashes, removed=()):
+        """Upsert {recipe_key: hash} and drop the removed keys"""
+        if hashes:
+            self.env.cr.execute("""
+                INSERT INTO recipe_sync_hash (recipe_key, content_hash)
+                     SELECT key, hash FROM unnest(%s::varchar[], %s::varchar[]) AS h(key, hash)
+                ON CONFLICT (recipe_key) DO UPDATE SET content_hash = EXCLUDED.content_hash
+            """, [list(hashes), list(hashes.values())])
+        if removed:
+            self.env.cr.execute("DELETE FROM recipe_sync_hash WHERE recipe_key = ANY(%s)", [list(removed)])
+        self.invalidate_model()
+
+
+class RecipeSyncBundle(models.AbstractModel):
+    """Delta replication of the recipe catalog between databases.
+
+    Recipes, lines and ingredients are referenced by product internal reference
+    or barcode. A bundle holds the recipes whose content hash changed since a
+    base export, and the keys of the recipes gone since. The base is explicit:
+    the id of the last bundle the receiving database applied, which it reports.
+    """
+    _name = 'recipe.sync.bundle'
+    _description = 'Recipe Catalog Bundle'
+
+    @api.model
+    def _get_uom_references(self, uoms):
+        """Return {uom id: reference} of UoMs across databases.
+
+        Names are translated and not unique, so a UoM is referenced by its
+        external id, with its category and ratio for UoMs created by hand.
+        """
+        def stable_xmlid(xmlids):
+            return next((xmlid for xmlid in xmlids if not xmlid.startswith('__')), None)
+
+        uom_xmlids = uoms._get_external_ids()
+        category_xmlids = uoms.category_id._get_external_ids()
+        return {
+            uom.id: {
+                'xmlid': stable_xmlid(uom_xmlids.get(uom.id, [])),
+                'category': (stable_xmlid(category_xmlids.get(uom.category_id.id, []))
+                             or uom.category_id.with_context(lang='en_US').name),
+                'factor': uom.factor,
+            }
+            for uom in uoms
+        }
+
+    @api.model
+    def _match_uoms(self, references):
+        """Return {uom key: local uom} of the given references, raising when one has no match"""
+        UoM = self.env['uom.uom'].with_context(active_test=False)
+        by_xmlid = {}
+        by_ratio = {}
+        for uom_id, reference in self._get_uom_references(UoM.search([], order='id')).items():
+            if reference['xmlid']:
+                by_xmlid[reference['xmlid']] = uom_id
+            by_ratio.setdefault(_uom_key(reference)[1:], uom_id)
+
+        matches = {}
+        unknown = []
+        for reference in references:
+            key = _uom_key(reference)
+            uom_id = by_xmlid.get(reference['xmlid']) or by_ratio.get(key[1:])
+            if uom_id:
+                matches[key] = UoM.browse(uom_id)
+            else:
+                unknown.append(reference['xmlid'] or f"{reference['category']} x{key[2]}")
+        if unknown:
+            raise UserError(_('No unit of measure of this database matches %s.', ', '.join(sorted(set(unknown)))))
+        return matches
+
+    @api.model
+    def _get_recipe_payloads(self):
+        """Return ({recipe_key: payload}, recipes skipped for lack of a product reference)"""
+        recipes = self.env['restaurant.recipe'].search([])
+        uoms = self._get_uom_references(recipes.ingredient_line_ids.uom_id)
+        payloads = {}
+        skipped = []
+        for recipe in recipes:
+            key = _product_key(recipe.product_id)
+            lines = [{
+                'product': _product_key(line.product_id),
+                'quantity': line.quantity,
+                'uom': uoms[line.uom_id.id],
+                'sequence': line.sequence,
+            } for line in recipe.ingredient_line_ids]
+            if not key or any(not line['product'] for line in lines):
+                skipped.append(recipe.display_name)
+                continue
+            payload = {field: recipe[field] or False for field in BUNDLE_RECIPE_FIELDS}
+            payload['lines'] = lines
+            payloads[key] = payload
+        return payloads, skipped
+
+    @api.model
+    def _export_bundle(self, base=None):
+        """Return (gzipped bundle, stats) of the recipes changed since the ``base`` bundle.
+
+        Without a base every recipe is exported. Nothing is assumed about the
+        delivery: the hashes of each export are kept, and the receiver's next
+        base says which one it applied.
+        """
+        Export = self.env['recipe.sync.export']
+        payloads, skipped = self._get_recipe_payloads()
+        previous = {}
+        if base:
+            snapshot = Export.search([('bundle_uuid', '=', base)], limit=1)
+            if not snapshot:
+                raise UserError(_('Bundle %s was not exported from this database, export a full bundle.', base))
+            previous = snapshot.hashes or {}
+
+        changed = {}
+        hashes = {}
+        for key, payload in payloads.items():
+            content_hash = hashes[key] = _content_hash(payload)
+            if previous.get(key) != content_hash:
+                changed[key] = dict(payload, hash=content_hash)
+        removed = sorted(previous.keys() - payloads.keys())
+
+        bundle_uuid = str(uuid.uuid4())
+        bundle = {
+            'format': BUNDLE_FORMAT,
+            'version': BUNDLE_VERSION,
+            'id': bundle_uuid,
+            'base': base or None,
+            'date': fields.Datetime.to_string(fields.Datetime.now()),
+            'full': not base,
+            'recipes': changed,
+            'removed': removed,
+        }
+        Export.create({'bundle_uuid': bundle_uuid, 'hashes': hashes})
+        Export.search([])[EXPORT_SNAPSHOTS_KEPT:].unlink()
+        data = gzip.compress(json.dumps(bundle, separators=(',', ':')).encode())
+        return data, {
+            'bundle': bundle_uuid,
+            'recipes': len(payloads),
+            'changed': len(changed),
+            'removed': len(removed),
+            'skipped': skipped,
+            'size': len(data),
+        }
+
+    @api.model
+    def _read_bundle(self, data):
+        try:
+            bundle = json.loads(gzip.decompress(data))
+        except (OSError, ValueError):
+            raise UserError(_('This file is not a recipe bundle.'))
+        if bundle.get('format') != BUNDLE_FORMAT:
+            raise UserError(_('This file is not a recipe bundle.'))
+        if bundle.get('version') != BUNDLE_VERSION:
+            raise UserError(_('Unsupported recipe bundle version %s.', bundle.get('version')))
+        return bundle
+
+    @api.model
+    def _find_products(self, keys):
+        """Return {product key: product} of the given keys, in two queries"""
+        Product = self.env['product.product'].with_context(active_test=False)
+        by_field = {'default_code': set(), 'barcode': set()}
+        for key in keys:
+            field, _sep, value = key.partition(':')
+            by_field[field].add(value)
+        products = {}
+        for field, values in by_field.items():
+            if values:
+                for product in Product.search([(field, 'in', list(values))]):
+                    products.setdefault(f'{field}:{product[field]}', product)
+        return products
+
+    @api.model
+    def _import_bundle(self, data, batch_size=500):
+        """Apply a bundle, writing only the recipes whose hash differs from the last import.
+
+        A delta bundle must be based on the last bundle applied here. The
+        bundle becomes the new base only when every recipe of it applied.
+        """
+        bundle = self._read_bundle(data)
+        ICP = self.env['ir.config_parameter'].sudo()
+        last_import = ICP.get_param(LAST_IMPORT_PARAM)
+        if not bundle['full'] and bundle['base'] != last_import:
+            raise UserError(_(
+                'This bundle holds the changes since bundle %(base)s, but the last bundle applied here is '
+                '%(last)s. Export the changes since %(last)s, or a full bundle.',
+                base=bundle['base'], last=last_import or _('none')))
+        Hash = self.env['recipe.sync.hash']
+        Recipe = self.env['restaurant.recipe'].with_context(active_test=False)
+        previous = {} if bundle['full'] else Hash._get_hashes()
+        todo = [(key, payload) for key, payload in bundle['recipes'].items() if previous.get(key) != payload['hash']]
+        stats = {'bundle': bundle['id'], 'created': 0, 'updated': 0,
+                 'unchanged': len(bundle['recipes']) - len(todo), 'archived': 0, 'errors': []}
+
+        # Every unit is matched before anything is written
+        uoms = self._match_uoms([line['uom'] for _key, payload in todo for line in payload['lines']])
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            product_keys = {key for key, _payload in batch}
+            product_keys.update(line['product'] for _key, payload in batch for line in payload['lines'])
+            products = self._find_products(product_keys)
+            menu_items = [products[key] for key, _payload in batch if key in products]
+            recipes = {
+                recipe.product_id.id: recipe
+                for recipe in Recipe.search([('product_id', 'in', [product.id for product in menu_items])])
+            }
+
+            hashes = {}
+            create_vals = []
+            for key, payload in batch:
+                unknown = [product_key for product_key in [key] + [line['product'] for line in payload['lines']]
+                           if product_key not in products]
+                if unknown:
+                    stats['errors'].append(_('%(recipe)s: unknown products %(products)s',
+                                             recipe=payload['name'], products=', '.join(unknown)))
+                    continue
+                line_vals = []
+                for line in payload['lines']:
+                    product = products[line['product']]
+                    line_vals.append({
+                        'product_id': product.id,
+                        'quantity': line['quantity'],
+                        'uom_id': uoms[_uom_key(line['uom'])].id,
+                        'sequence': line['sequence'],
+                    })
+                vals = {field: payload[field] for field in BUNDLE_RECIPE_FIELDS}
+                recipe = recipes.get(products[key].id)
+                if recipe:
+                    # Rewritten lines resync the BOM of this recipe only
+                    vals['active'] = True
+                    vals['ingredient_line_ids'] = [Command.clear()] + [Command.create(v) for v in line_vals]
+                    recipe.write(vals)
+                    stats['updated'] += 1
+                else:
+                    vals['product_id'] = products[key].id
+                    vals['ingredient_line_ids'] = [Command.create(v) for v in line_vals]
+                    create_vals.append(vals)
+                hashes[key] = payload['hash']
+            if create_vals:
+                Recipe.create(create_vals)
+                stats['created'] += len(create_vals)
+            Hash._set_hashes(hashes)
+            # Keep the memory of a large bundle bounded
+            self.env.flush_all()
+            self.env.invalidate_all()
+
+        removed = bundle['removed']
+        if removed:
+            products = self._find_products(removed)
+            recipes = Recipe.search([('product_id', 'in', [product.id for product in products.values()]),
+                                     ('active', '=', True)])
+            recipes.action_archive()
+            stats['archived'] = len(recipes)
+            Hash._set_hashes({}, removed)
+        if not stats['errors']:
+            ICP.set_param(LAST_IMPORT_PARAM, bundle['id'])
+        _logger.info("Imported recipe bundle: %s", {key: value for key, value in stats.items() if key != 'errors'})
+        return stats
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+from odoo.tools import date_utils
+
+from .recipe_cost_source import COST_SOURCES
+
+# Company fields deciding the ingredient prices of the recipes
+COST_SOURCE_FIELDS = {'recipe_cost_source', 'recipe_cost_average_days', 'recipe_rate_date_type', 'recipe_rate_date'}
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    recipe_cost_source = fields.Selection(
+        COST_SOURCES,
+        string='Recipe Cost Source',
+        default='standard',
+        required=True,
+        help="Ingredient price used to cost the recipes of this company"
+    )
+    recipe_cost_average_days = fields.Integer(
+        string='Average Cost Period (days)',
+        default=90,
+        help="Receipts averaged by the rolling average cost source"
+    )
+    recipe_rate_date_type = fields.Selection([
+        ('today', 'Costing Date'),
+        ('month', 'First Day of the Month'),
+        ('fixed', 'Fixed Date'),
+    ], string='Recipe Rate Date', default='today', required=True,
+        help="Date of the exchange rates converting ingredient costs into the recipe currency"
+    )
+    recipe_rate_date = fields.Date(
+        string='Recipe Fixed Rate Date',
+        help="Exchange rate date of the recipe costs when using a fixed date"
+    )
+
+    def _get_recipe_rate_date(self):
+        """Date of the exchange rates of recipe costing"""
+        self.ensure_one()
+        today = fields.Date.context_today(self)
+        if self.recipe_rate_date_type == 'month':
+            return date_utils.start_of(today, 'month')
+        if self.recipe_rate_date_type == 'fixed' and self.recipe_rate_date:
+            return self.recipe_rate_date
+        return today
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.keys() & COST_SOURCE_FIELDS:
+            # Recost the recipe lines of these companies with the new source
+            self.env['recipe.cost.source']._recompute_costs(companies=self)
+        return res
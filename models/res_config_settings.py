@@ -62,6 +62,65 @@ class ResConfigSettings(models.TransientModel):
         help="Recipes above this food cost % will be flagged"
     )
 
+    # POS consumption
+    recipe_aggregate_consumption = fields.Boolean(
+        string='Aggregate Recipe Consumption',
+        config_parameter='pos_recipe_costing.aggregate_consumption',
+        help="Post recipe ingredient usage as one move per ingredient at session closing "
+             "instead of stock moves on every order"
+    )
+
+    # Cost source
+    recipe_cost_source = fields.Selection(
+        related='company_id.recipe_cost_source',
+        readonly=False
+    )
+    recipe_cost_average_days = fields.Integer(
+        related='company_id.recipe_cost_average_days',
+        readonly=False
+    )
+    recipe_rate_date_type = fields.Selection(
+        related='company_id.recipe_rate_date_type',
+        readonly=False
+    )
+    recipe_rate_date = fields.Date(
+        related='company_id.recipe_rate_date',
+        readonly=False
+    )
+
+    # Cost history retention
+    recipe_cost_history_full_days = fields.Integer(
+        string='Full Cost History (days)',
+        config_parameter='pos_recipe_costing.cost_history_full_days',
+        default=90,
+        help="Every cost change is kept this many days, older changes are reduced to one per month"
+    )
+    recipe_cost_history_keep_months = fields.Integer(
+        string='Cost History Retention (months)',
+        config_parameter='pos_recipe_costing.cost_history_keep_months',
+        help="Cost history older than this is removed, 0 keeps it forever"
+    )
+
+    # Diagnostics
+    recipe_instrumentation = fields.Boolean(
+        string='Performance Instrumentation',
+        config_parameter='pos_recipe_costing.instrumentation',
+        help="Record the duration and SQL queries of recipe costing operations"
+    )
+
+    # Cycle counts
+    recipe_cycle_count = fields.Boolean(
+        string='Ingredient Cycle Counts',
+        config_parameter='pos_recipe_costing.cycle_count',
+        help="Open small daily stocktakes of the ingredients due, A weekly, B monthly and C quarterly"
+    )
+    recipe_cycle_count_size = fields.Integer(
+        string='Ingredients per Cycle Count',
+        config_parameter='pos_recipe_costing.cycle_count_size',
+        default=40,
+        help="Maximum lines of a generated stocktake, the other due ingredients wait for the next day"
+    )
+
     # Stocktake Settings
     stocktake_gain_account_id = fields.Many2one(
         'account.account',
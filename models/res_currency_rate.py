@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class ResCurrencyRate(models.Model):
+    _inherit = 'res.currency.rate'
+
+    def _recompute_recipe_costs(self):
+        """Recost the recipes converted with these rates"""
+        companies = None if any(not rate.company_id for rate in self) else self.company_id
+        self.env['recipe.cost.source']._recompute_rates(companies)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        rates = super().create(vals_list)
+        rates._recompute_recipe_costs()
+        return rates
+
+    def write(self, vals):
+        res = super().write(vals)
+        self._recompute_recipe_costs()
+        return res
+
+    def unlink(self):
+        self._recompute_recipe_costs()
+        return super().unlink()
@@ -1,11 +1,32 @@
 # -*- coding: utf-8 -*-
-from odoo import api, fields, models, _
+from collections import defaultdict
+
+import numpy as np
+
+from odoo import api, fields, models, SUPERUSER_ID, _
 from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+from .recipe_perf_sample import instrument
+
+# Recipe fields held by the costing catalog
+CATALOG_FIELDS = {'active', 'company_id', 'product_id', 'portion_size', 'ingredient_line_ids'}
+
+# Recipe fields mirrored on the generated BOM
+BOM_SYNC_FIELDS = {'ingredient_line_ids', 'product_id', 'portion_size'}
+
+# Advisory lock namespace of the BOM sync, and how long to wait for a concurrent save
+BOM_SYNC_LOCK = 0x52435042
+BOM_SYNC_LOCK_TIMEOUT = '5s'
+
+# Ingredients whose recipes get their portions refreshed after the commit
+PORTIONS_REFRESH_KEY = 'pos_recipe_costing.portions_products'
 
 
 class RestaurantRecipe(models.Model):
     _name = 'restaurant.recipe'
     _description = 'Restaurant Recipe'
+    _inherit = ['mail.thread', 'mail.activity.mixin']
     _order = 'name'
 
     name = fields.Char(string='Recipe Name', required=True)
@@ -55,6 +76,14 @@ class RestaurantRecipe(models.Model):
     )
 
     # Cost fields
+    company_id = fields.Many2one(
+        'res.company',
+        string='Company',
+        required=True,
+        index=True,
+        default=lambda self: self.env.company,
+        help="Company whose cost source and exchange rates cost this recipe"
+    )
     currency_id = fields.Many2one(
         'res.currency',
         string='Currency',
@@ -72,7 +101,7 @@ class RestaurantRecipe(models.Model):
     )
     selling_price = fields.Float(
         string='Selling Price',
-        related='product_id.lst_price'
+        compute='_compute_selling_price'
     )
     food_cost_percentage = fields.Float(
         string='Food Cost %',
@@ -85,26 +114,73 @@ class RestaurantRecipe(models.Model):
         store=True
     )
 
+    # Stock availability (flattened kit explosion)
+    explosion_line_ids = fields.One2many(
+        'recipe.explosion.line',
+        'recipe_id',
+        string='Flattened Ingredients',
+        readonly=True
+    )
+    portions_available = fields.Integer(
+        string='Portions Available',
+        readonly=True,
+        copy=False,
+        help="Portions that can still be made from the ingredients on hand"
+    )
+
     # Preparation info
     prep_time = fields.Float(string='Prep Time (mins)')
     cook_time = fields.Float(string='Cook Time (mins)')
     instructions = fields.Html(string='Preparation Instructions')
 
+    # Margin alerts
+    user_id = fields.Many2one(
+        'res.users',
+        string='Responsible',
+        default=lambda self: self.env.user,
+        help="User notified when the food cost of this recipe crosses the threshold"
+    )
+    margin_alert_state = fields.Selection([
+        ('ok', 'Within Threshold'),
+        ('high', 'High Food Cost'),
+    ], string='Margin Alert', default='ok', readonly=True, copy=False)
+
     _sql_constraints = [
         ('product_unique', 'unique(product_id)', 'A recipe already exists for this product!')
     ]
 
+    def init(self):
+        # Keyset order of the costing feed
+        create_index(self.env.cr, 'restaurant_recipe_write_date_id_idx', self._table, ['write_date', 'id'])
+
     @api.depends('ingredient_line_ids')
     def _compute_ingredient_count(self):
         for recipe in self:
             recipe.ingredient_count = len(recipe.ingredient_line_ids)
 
     @api.depends('ingredient_line_ids.cost')
+    @instrument('recipe.compute_total_cost')
     def _compute_total_cost(self):
         for recipe in self:
             recipe.total_cost = sum(recipe.ingredient_line_ids.mapped('cost'))
 
+    @api.depends('product_id.lst_price', 'company_id', 'currency_id')
+    def _compute_selling_price(self):
+        for recipe in self:
+            recipe.selling_price = recipe.product_id.lst_price * recipe._get_company_rate()
+
+    def _get_company_rate(self, reverse=False):
+        """Rate converting the recipe's company currency amounts into the recipe currency, or back"""
+        self.ensure_one()
+        company = self.company_id or self.env.company
+        currencies = (company.currency_id, self.currency_id or company.currency_id)
+        if reverse:
+            currencies = currencies[::-1]
+        return self.env['recipe.cost.source']._get_conversion_rate(
+            *currencies, company, company._get_recipe_rate_date())
+
     @api.depends('total_cost', 'portion_size', 'selling_price')
+    @instrument('recipe.compute_costs')
     def _compute_costs(self):
         for recipe in self:
             if recipe.portion_size:
@@ -122,35 +198,79 @@ class RestaurantRecipe(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
-        for record in records:
+        self.env['recipe.costing.catalog']._invalidate_catalog()
+        for record in records.sorted('id'):
             if record.ingredient_line_ids:
                 record._sync_bom()
         return records
 
     def write(self, vals):
+        sync = vals.keys() & BOM_SYNC_FIELDS
+        if sync:
+            # Wait for another save in progress before doing the work
+            self._lock_for_sync()
+            self._lock_rows()
         res = super().write(vals)
+        if vals.keys() & CATALOG_FIELDS:
+            self.env['recipe.costing.catalog']._invalidate_catalog()
         # Sync BOM if ingredients or product changed
-        if 'ingredient_line_ids' in vals or 'product_id' in vals or 'portion_size' in vals:
-            for record in self:
+        if sync:
+            for record in self.sorted('id'):
                 record._sync_bom()
         return res
 
     def unlink(self):
         # Delete associated BOMs
         boms = self.mapped('bom_id')
+        parents = self._get_parent_recipes()
         res = super().unlink()
+        self.env['recipe.costing.catalog']._invalidate_catalog()
         boms.unlink()
+        # Parent recipes now consume the former sub-recipe product as is
+        parents.exists()._update_explosion()
         return res
 
+    def _lock_for_sync(self):
+        """Take the BOM sync locks of these recipes, in id order to avoid deadlocks.
+
+        When another transaction holds one, wait for it up to the sync lock
+        timeout and go on. A wait running out raises a lock error, which RPC
+        calls and the batch jobs retry in a fresh transaction.
+        """
+        cr = self.env.cr
+        lock_timeout = None
+        for recipe_id in sorted(self.ids):
+            cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", [BOM_SYNC_LOCK, recipe_id])
+            if cr.fetchone()[0]:
+                continue
+            if lock_timeout is None:
+                cr.execute("SHOW lock_timeout")
+                lock_timeout = cr.fetchone()[0]
+                cr.execute("SELECT set_config('lock_timeout', %s, true)", [BOM_SYNC_LOCK_TIMEOUT])
+            cr.execute("SELECT pg_advisory_xact_lock(%s, %s)", [BOM_SYNC_LOCK, recipe_id])
+        if lock_timeout is not None:
+            cr.execute("SELECT set_config('lock_timeout', %s, true)", [lock_timeout])
+
+    def _lock_rows(self):
+        """Lock the recipe rows in id order before updating their stored costs"""
+        if self.ids:
+            self.env.cr.execute(
+                "SELECT id FROM restaurant_recipe WHERE id = ANY(%s) ORDER BY id FOR NO KEY UPDATE",
+                [self.ids],
+            )
+
+    @instrument('recipe.sync_bom')
     def _sync_bom(self):
         """Create or update the MRP BOM from recipe ingredients"""
         self.ensure_one()
+        self._lock_for_sync()
 
         if not self.ingredient_line_ids:
             # No ingredients, delete BOM if exists
             if self.bom_id:
                 self.bom_id.unlink()
                 self.bom_id = False
+            self._update_explosion()
             return
 
         BOM = self.env['mrp.bom']
@@ -163,6 +283,7 @@ class RestaurantRecipe(models.Model):
             'product_qty': self.portion_size or 1.0,
             'type': 'phantom',  # Kit - auto consumes on sale
             'code': f'RECIPE-{self.id}',
+            'recipe_id': self.id,
         }
 
         if self.bom_id:
@@ -175,13 +296,342 @@ class RestaurantRecipe(models.Model):
             self.bom_id = BOM.create(bom_vals)
 
         # Create BOM lines from recipe ingredients
+        bom_lines = BOMLine.create([{
+            'bom_id': self.bom_id.id,
+            'product_id': line.product_id.id,
+            'product_qty': line.quantity,
+            'product_uom_id': line.uom_id.id,
+        } for line in self.ingredient_line_ids])
+        for line, bom_line in zip(self.ingredient_line_ids, bom_lines):
+            line.bom_line_id = bom_line
+
+        self._update_explosion()
+
+    def _get_parent_recipes(self):
+        """Return the recipes using these recipes' products as ingredients, at any depth"""
+        RecipeLine = self.env['recipe.ingredient.line']
+        parents = self.browse()
+        todo = self
+        while todo:
+            todo = RecipeLine.search([
+                ('product_id', 'in', todo.product_id.ids)
+            ]).recipe_id - parents - self
+            parents |= todo
+        return parents
+
+    def _explode_ingredients(self, visited=None):
+        """Flatten the recipe into {(ingredient_id, bom_line_id): qty per unit sold}.
+
+        Quantities are converted to the ingredient's stock UoM and sub-recipes
+        (ingredients that have their own recipe) are exploded recursively, the
+        BOM line being the one of the leaf recipe line.
+        """
+        self.ensure_one()
+        visited = (visited or set()) | {self.id}
+        portions = self.portion_size or 1.0
+        sub_recipes = {
+            recipe.product_id.id: recipe
+            for recipe in self.search([('product_id', 'in', self.ingredient_line_ids.product_id.ids)])
+        }
+        result = defaultdict(float)
         for line in self.ingredient_line_ids:
-            BOMLine.create({
-                'bom_id': self.bom_id.id,
-                'product_id': line.product_id.id,
-                'product_qty': line.quantity,
-                'product_uom_id': line.uom_id.id,
-            })
+            qty = line.uom_id._compute_quantity(
+                line.quantity, line.product_id.uom_id, round=False, raise_if_failure=False
+            ) / portions
+            sub_recipe = sub_recipes.get(line.product_id.id)
+            if sub_recipe and sub_recipe.ingredient_line_ids and sub_recipe.id not in visited:
+                for key, sub_qty in sub_recipe._explode_ingredients(visited).items():
+                    result[key] += qty * sub_qty
+            else:
+                result[line.product_id.id, line.bom_line_id.id] += qty
+        return result
+
+    def _update_explosion(self):
+        """Rebuild the flattened explosion of these recipes and of every recipe using them"""
+        recipes = self | self._get_parent_recipes()
+        if not recipes:
+            return
+        Explosion = self.env['recipe.explosion.line'].sudo()
+        Explosion.search([('recipe_id', 'in', recipes.ids)]).unlink()
+        vals_list = []
+        for recipe in recipes:
+            for (product_id, bom_line_id), qty in recipe._explode_ingredients().items():
+                vals_list.append({
+                    'recipe_id': recipe.id,
+                    'product_id': product_id,
+                    'bom_line_id': bom_line_id or False,
+                    'quantity': qty,
+                })
+        Explosion.create(vals_list)
+        self.env['recipe.costing.catalog']._invalidate_catalog()
+        recipes._refresh_portions_available()
+
+    def _refresh_portions_available(self):
+        """Recompute portions available from on-hand stock with one grouped quant query"""
+        if not self:
+            return
+        explosion = self.env['recipe.explosion.line'].sudo()._read_group(
+            [('recipe_id', 'in', self.ids), ('quantity', '>', 0)],
+            ['recipe_id', 'product_id'],
+            ['quantity:sum'],
+        )
+        product_ids = {product.id for _recipe, product, _qty in explosion}
+        on_hand = {
+            product.id: qty
+            for product, qty in self.env['stock.quant'].sudo()._read_group(
+                [('product_id', 'in', list(product_ids)), ('location_id.usage', '=', 'internal')],
+                ['product_id'],
+                ['quantity:sum'],
+            )
+        }
+
+        portions = {}
+        for recipe, product, qty in explosion:
+            available = max(on_hand.get(product.id, 0.0), 0.0) / qty
+            portions[recipe.id] = min(portions.get(recipe.id, available), available)
+
+        # Plain SQL on the changed rows only: unchanged recipes are neither
+        # locked nor moved past the write_date watermarks of the feeds
+        self.flush_recordset(['portions_available'])
+        self.env.cr.execute("""
+            UPDATE restaurant_recipe r
+               SET portions_available = v.portions
+              FROM unnest(%s::int[], %s::int[]) AS v(id, portions)
+             WHERE r.id = v.id
+               AND r.portions_available IS DISTINCT FROM v.portions
+        """, [self.ids, [int(portions.get(recipe_id, 0)) for recipe_id in self.ids]])
+        self.invalidate_recordset(['portions_available'])
+
+    @api.model
+    def _refresh_portions_for_products(self, product_ids):
+        """Refresh the recipes consuming the given ingredients after a stock change"""
+        if not product_ids:
+            return
+        recipes = self.env['recipe.explosion.line'].sudo().search([
+            ('product_id', 'in', list(product_ids))
+        ]).recipe_id
+        recipes._refresh_portions_available()
+
+    @api.model
+    def _refresh_portions_after_commit(self, product_ids):
+        """Refresh the recipes consuming the given ingredients once this transaction commits.
+
+        The refresh runs in a transaction of its own, keeping it off the stock
+        moves validated by every POS order.
+        """
+        if not product_ids:
+            return
+        data = self.env.cr.postcommit.data
+        if PORTIONS_REFRESH_KEY in data:
+            data[PORTIONS_REFRESH_KEY].update(product_ids)
+            return
+        pending = data[PORTIONS_REFRESH_KEY] = set(product_ids)
+        registry = self.env.registry
+
+        @self.env.cr.postcommit.add
+        def refresh_portions_available():
+            with registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                env['restaurant.recipe']._refresh_portions_for_products(pending)
+
+    @api.model
+    def _get_kit_explosion(self, products, company):
+        """Return the precomputed explosion of the recipe kits among ``products``.
+
+        Reads the flattened explosion of every product in one query, keeping only
+        the kits for which the MRP machinery would pick the recipe BOM and whose
+        components are not kits themselves.
+
+        :return: {kit product id: [(component id, bom line id, qty per unit)]}
+        """
+        if not products:
+            return {}
+        BOM = self.env['mrp.bom'].sudo()
+        boms = BOM._bom_find(products, company_id=company.id, bom_type='phantom')
+        bom_ids = [bom.id for bom in boms.values() if bom]
+        if not bom_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT r.product_id, r.bom_id, e.product_id, e.bom_line_id, e.quantity
+              FROM recipe_explosion_line e
+              JOIN restaurant_recipe r ON r.id = e.recipe_id
+             WHERE r.bom_id = ANY(%s)
+               AND e.quantity > 0
+        """, [bom_ids])
+        explosion = defaultdict(list)
+        for product_id, bom_id, component_id, bom_line_id, qty in self.env.cr.fetchall():
+            product = self.env['product.product'].browse(product_id)
+            if boms.get(product) and boms[product].id == bom_id:
+                explosion[product_id].append((component_id, bom_line_id, qty))
+
+        # Components having a kit of their own are left to the MRP explosion
+        components = self.env['product.product'].browse(
+            {row[0] for rows in explosion.values() for row in rows}
+        )
+        nested = {
+            product.id
+            for product, bom in BOM._bom_find(components, company_id=company.id, bom_type='phantom').items()
+            if bom
+        }
+        return {
+            product_id: rows
+            for product_id, rows in explosion.items()
+            if not any(row[0] in nested for row in rows)
+        }
+
+    @api.model
+    def _get_costing_matrix(self):
+        """Active recipes as a sparse recipe x ingredient matrix in COO form.
+
+        :return: (recipe ids, ingredient ids, rows, cols, qty per portion)
+        """
+        return self.env['recipe.costing.catalog']._get_catalog().costing_matrix()
+
+    @api.model
+    def _get_explosion_matrix(self):
+        """Flattened explosion of active recipes as menu item x ingredient COO arrays.
+
+        :return: (menu item ids, ingredient ids, rows, cols, qty per unit sold)
+        """
+        return self.env['recipe.costing.catalog']._get_catalog().explosion_matrix()
+
+    @api.model
+    def _get_direct_line_matrix(self):
+        """One level of active recipe lines as menu item x ingredient COO arrays.
+
+        Quantities are per unit sold and converted to the ingredient's stock UoM.
+
+        :return: (menu item ids, ingredient ids, rows, cols, qty per unit sold)
+        """
+        return self.env['recipe.costing.catalog']._get_catalog().direct_matrix()
+
+    @api.model
+    def _simulate_price_changes(self, changes, currency=None):
+        """Compute the impact of hypothetical ingredient prices without writing anything.
+
+        :param changes: {product_id: (mode, value)} with mode 'percentage'
+            (relative change), 'amount' (price increase) or 'price' (new price)
+        :param currency: currency of the amounts, the company's by default
+        :return: list of dicts for the recipes whose cost changes
+        """
+        catalog = self.env['recipe.costing.catalog']._get_catalog(currency)
+        recipe_ids, product_ids = catalog.recipe_ids, catalog.ingredient_ids
+        if not len(recipe_ids):
+            return []
+
+        prices = catalog.prices
+        new_prices = prices.copy()
+        position = {product_id: index for index, product_id in enumerate(product_ids.tolist())}
+        for product_id, (mode, value) in changes.items():
+            index = position.get(product_id)
+            if index is None:
+                continue
+            if mode == 'percentage':
+                new_prices[index] = prices[index] * (1 + value / 100.0)
+            elif mode == 'amount':
+                new_prices[index] = prices[index] + value
+            else:
+                new_prices[index] = value
+
+        # One sparse matrix-vector product per price vector
+        current = catalog.costs_per_portion()
+        simulated = catalog.costs_per_portion(new_prices)
+        changed = np.flatnonzero(~np.isclose(current, simulated))
+        if not len(changed):
+            return []
+
+        recipes = self.browse(recipe_ids[changed].tolist())
+        selling = catalog.selling_prices[changed]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            current_fc = np.where(selling > 0, current[changed] / selling * 100, 0.0)
+            simulated_fc = np.where(selling > 0, simulated[changed] / selling * 100, 0.0)
+        return [{
+            'recipe_id': recipe.id,
+            'current_cost': float(current[index]),
+            'simulated_cost': float(simulated[index]),
+            'current_food_cost': float(current_fc[pos]),
+            'simulated_food_cost': float(simulated_fc[pos]),
+            'selling_price': float(selling[pos]),
+        } for pos, (recipe, index) in enumerate(zip(recipes, changed.tolist()))]
+
+    @api.model
+    def _get_write_date_horizon(self):
+        """Return the write_date before which every row written is committed.
+
+        Rows get the start time of their transaction as write_date, and may
+        commit long after it: only the rows older than the start of the oldest
+        transaction still running are settled.
+        """
+        self.env.cr.execute("""
+            SELECT LEAST(now(), MIN(xact_start)) AT TIME ZONE 'UTC'
+              FROM pg_stat_activity
+             WHERE datname = current_database()
+               AND backend_type = 'client backend'
+               AND pid != pg_backend_pid()
+        """)
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _cron_margin_alerts(self):
+        """Raise or close food cost alerts for the recipes changed since the last run.
+
+        Only recipes written since the watermark are evaluated, unless the
+        threshold itself changed. The watermark is the write_date horizon at
+        the start of the run, so that recipes committed later by transactions
+        already running then are evaluated by the next run. Crossings in both directions are handled:
+        going above the threshold schedules an activity for the responsible,
+        going back below marks the open alert activities as done.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        threshold = float(ICP.get_param('pos_recipe_costing.high_food_cost_threshold', 35))
+        watermark = ICP.get_param('pos_recipe_costing.margin_alert_watermark')
+        last_threshold = ICP.get_param('pos_recipe_costing.margin_alert_threshold')
+        horizon = self._get_write_date_horizon()
+
+        domain = []
+        if watermark and last_threshold and float(last_threshold) == threshold:
+            domain = [('write_date', '>=', fields.Datetime.from_string(watermark))]
+        recipes = self.search_fetch(domain, ['food_cost_percentage', 'margin_alert_state', 'user_id'])
+
+        raised = recipes.filtered(lambda r: r.food_cost_percentage > threshold and r.margin_alert_state != 'high')
+        cleared = recipes.filtered(lambda r: r.food_cost_percentage <= threshold and r.margin_alert_state == 'high')
+
+        activity_type = self.env.ref('pos_recipe_costing.mail_activity_type_high_food_cost')
+        if raised:
+            res_model_id = self.env['ir.model']._get_id(self._name)
+            self.env['mail.activity'].sudo().create([{
+                'res_model_id': res_model_id,
+                'res_id': recipe.id,
+                'activity_type_id': activity_type.id,
+                'summary': _('Food cost %(cost).1f%% above %(threshold).1f%%',
+                             cost=recipe.food_cost_percentage, threshold=threshold),
+                'user_id': (recipe.user_id or recipe.create_uid).id,
+                'date_deadline': fields.Date.context_today(self),
+            } for recipe in raised])
+        if cleared:
+            self.env['mail.activity'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_id', 'in', cleared.ids),
+                ('activity_type_id', '=', activity_type.id),
+            ]).action_feedback(feedback=_('Food cost back under %.1f%%', threshold))
+
+        # Plain SQL so the alert state does not move write_date past the watermark
+        for state, alerted in (('high', raised), ('ok', cleared)):
+            if alerted:
+                self.env.cr.execute(
+                    "UPDATE restaurant_recipe SET margin_alert_state = %s WHERE id = ANY(%s)",
+                    [state, alerted.ids],
+                )
+        self.invalidate_model(['margin_alert_state'])
+
+        ICP.set_param('pos_recipe_costing.margin_alert_watermark', fields.Datetime.to_string(horizon))
+        ICP.set_param('pos_recipe_costing.margin_alert_threshold', threshold)
+
+    @api.model
+    def _cron_refresh_portions_available(self):
+        """Full rebuild, catching ingredient UoM changes and stock moved outside of stock moves"""
+        recipes = self.search([])
+        recipes._update_explosion()
 
     def action_view_bom(self):
         """Open the linked BOM"""
@@ -196,9 +646,18 @@ class RestaurantRecipe(models.Model):
             'res_id': self.bom_id.id,
         }
 
+    def action_view_cost_history(self):
+        """Open the cost history of this recipe"""
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('pos_recipe_costing.action_recipe_cost_history')
+        action['domain'] = [('recipe_id', '=', self.id)]
+        action['context'] = {'default_recipe_id': self.id}
+        return action
+
     def action_create_bom(self):
         """Force create/sync BOM"""
-        for recipe in self:
+        self._lock_for_sync()
+        for recipe in self.sorted('id'):
             if not recipe.ingredient_line_ids:
                 raise UserError(_('Add ingredients before creating a BOM.'))
             recipe._sync_bom()
@@ -214,7 +673,8 @@ class RestaurantRecipe(models.Model):
 
     def action_recalculate_costs(self):
         """Force recalculate all costs"""
-        for recipe in self:
+        self._lock_rows()
+        for recipe in self.sorted('id'):
             recipe.ingredient_line_ids._compute_cost()
             recipe._compute_total_cost()
             recipe._compute_costs()
@@ -222,9 +682,11 @@ class RestaurantRecipe(models.Model):
 
     def action_update_product_cost(self):
         """Update the linked product's standard price with recipe cost"""
-        for recipe in self:
+        # Products in id order, like every other cost update, to avoid deadlocks
+        for recipe in self.sorted(lambda r: r.product_id.id):
             if recipe.product_id and recipe.cost_per_portion:
-                recipe.product_id.standard_price = recipe.cost_per_portion
+                product = recipe.product_id.with_company(recipe.company_id)
+                product.standard_price = recipe.cost_per_portion * recipe._get_company_rate(reverse=True)
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
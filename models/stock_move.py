@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from odoo import models
+
+from .recipe_cost_source import RECEIPT_SOURCES
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    def action_explode(self):
+        if self.env.context.get('recipe_kit_exploded'):
+            return self
+        return super().action_explode()
+
+    def _action_done(self, cancel_backorder=False):
+        moves = super()._action_done(cancel_backorder=cancel_backorder)
+        moves._recompute_recipe_costs()
+        # Keep the cached portions available in line with the new quants, after the commit
+        self.env['restaurant.recipe']._refresh_portions_after_commit(moves.product_id.ids)
+        return moves
+
+    def _recompute_recipe_costs(self):
+        """Recost the recipes priced from the vendor receipts among these moves"""
+        receipts = self.filtered(lambda move: move.state == 'done' and move.location_id.usage == 'supplier')
+        if not receipts:
+            return
+        CostSource = self.env['recipe.cost.source']
+        companies = CostSource._get_companies_using(RECEIPT_SOURCES) & receipts.company_id
+        for company in companies:
+            company_receipts = receipts.filtered(lambda move: move.company_id == company)
+            CostSource._recompute_costs(company_receipts.product_id, company)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from odoo import api, models
+from odoo.tools import float_is_zero
+
+
+class StockPicking(models.Model):
+    _inherit = 'stock.picking'
+
+    @api.model
+    def _create_picking_from_pos_order_lines(self, location_dest_id, lines, picking_type, partner=False):
+        """In aggregated consumption mode, record recipe usage instead of moving ingredients.
+
+        Kit lines are written to the theoretical consumption table and posted
+        as one move per ingredient when the session closes.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if not ICP.get_param('pos_recipe_costing.aggregate_consumption') or not lines:
+            return super()._create_picking_from_pos_order_lines(location_dest_id, lines, picking_type, partner=partner)
+
+        explosion = self.env['restaurant.recipe']._get_kit_explosion(lines.product_id, picking_type.company_id)
+        kit_lines = lines.filtered(
+            lambda l: l.product_id.id in explosion
+            and not float_is_zero(l.qty, precision_rounding=l.product_id.uom_id.rounding)
+        )
+        if kit_lines:
+            self._record_recipe_consumption(kit_lines, explosion, picking_type.default_location_src_id, location_dest_id)
+        return super()._create_picking_from_pos_order_lines(
+            location_dest_id, lines - kit_lines, picking_type, partner=partner
+        )
+
+    @api.model
+    def _record_recipe_consumption(self, lines, explosion, location, location_dest_id):
+        usage = defaultdict(float)
+        for line in lines:
+            for component_id, _bom_line_id, qty in explosion[line.product_id.id]:
+                usage[line.order_id, component_id] += line.qty * qty
+        self.env['recipe.consumption.line'].sudo().create([{
+            'session_id': order.session_id.id,
+            'order_id': order.id,
+            'date': order.date_order,
+            'product_id': component_id,
+            'quantity': qty,
+            'location_id': location.id,
+            'location_dest_id': location_dest_id,
+        } for (order, component_id), qty in usage.items()])
+
+    def _create_move_from_pos_order_lines(self, lines):
+        """Create the ingredient moves of recipe kits from the precomputed explosion.
+
+        Kit lines are exploded with one query for the whole order instead of
+        going through the BOM explosion of each kit move; other lines follow
+        the standard flow.
+        """
+        self.ensure_one()
+        explosion = self.env['restaurant.recipe']._get_kit_explosion(lines.product_id, self.company_id)
+        kit_lines = lines.filtered(lambda l: l.product_id.id in explosion)
+        if kit_lines:
+            self._create_kit_moves_from_pos_order_lines(kit_lines, explosion)
+        other_lines = lines - kit_lines
+        if other_lines:
+            super()._create_move_from_pos_order_lines(other_lines)
+
+    def _create_kit_moves_from_pos_order_lines(self, lines, explosion):
+        component_qty = defaultdict(float)
+        for line in lines:
+            for component_id, bom_line_id, qty in explosion[line.product_id.id]:
+                component_qty[component_id, bom_line_id] += abs(line.qty) * qty
+
+        components = self.env['product.product'].browse({key[0] for key in component_qty})
+        products = {product.id: product for product in components}
+        move_vals = []
+        for (component_id, bom_line_id), qty in component_qty.items():
+            product = products[component_id]
+            move_vals.append({
+                'name': product.display_name,
+                'product_id': component_id,
+                'product_uom': product.uom_id.id,
+                'product_uom_qty': qty,
+                'bom_line_id': bom_line_id or False,
+                'picking_id': self.id,
+                'picking_type_id': self.picking_type_id.id,
+                'location_id': self.location_id.id,
+                'location_dest_id': self.location_dest_id.id,
+                'company_id': self.company_id.id,
+            })
+        moves = self.env['stock.move'].create(move_vals)
+        # Components are already flattened, skip the phantom BOM explosion
+        confirmed_moves = moves.with_context(recipe_kit_exploded=True)._action_confirm()
+        confirmed_moves._add_mls_related_to_order(lines, are_qties_done=True)
+        confirmed_moves.picked = True
+        return confirmed_moves
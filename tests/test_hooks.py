@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import TransactionCase, tagged
+from odoo.tools.sql import column_exists
+
+from odoo.addons.pos_recipe_costing.hooks import _precreate_stored_columns
+
+
+@tagged('post_install', '-at_install')
+class TestPrecreateStoredColumns(TransactionCase):
+
+    def _drop_columns(self, columns):
+        for table, column in columns:
+            self.env.cr.execute(f'ALTER TABLE "{table}" DROP COLUMN "{column}" CASCADE')
+
+    def test_fresh_install(self):
+        """The hook runs before any table or column of the module exists"""
+        cr = self.env.cr
+        self.env.flush_all()
+        with cr.savepoint(flush=False) as savepoint:
+            cr.execute('ALTER TABLE restaurant_recipe RENAME TO restaurant_recipe_hidden')
+            self._drop_columns([
+                ('product_template', 'has_recipe'),
+                ('product_template', 'is_ingredient'),
+                ('product_product', 'has_recipe'),
+                ('product_product', 'is_ingredient'),
+            ])
+            _precreate_stored_columns(self.env)
+            self.assertTrue(column_exists(cr, 'product_template', 'has_recipe'))
+            self.assertTrue(column_exists(cr, 'product_product', 'has_recipe'))
+            self.assertTrue(column_exists(cr, 'product_product', 'is_ingredient'))
+            self.assertFalse(column_exists(cr, 'product_template', 'is_ingredient'))
+            savepoint.rollback()
+        self.env.invalidate_all()
+
+    def test_upgrade(self):
+        """Upgrading fills the variant flags from their template"""
+        ingredient = self.env['product.template'].create({'name': 'Hook Flour', 'is_ingredient': True})
+        other = self.env['product.template'].create({'name': 'Hook Plate'})
+        self.env.flush_all()
+        cr = self.env.cr
+        with cr.savepoint(flush=False) as savepoint:
+            self._drop_columns([('product_product', 'is_ingredient')])
+            _precreate_stored_columns(self.env)
+            cr.execute("SELECT id, is_ingredient FROM product_product WHERE id IN %s",
+                       [(ingredient.product_variant_id.id, other.product_variant_id.id)])
+            flags = dict(cr.fetchall())
+            self.assertTrue(flags[ingredient.product_variant_id.id])
+            self.assertFalse(flags[other.product_variant_id.id])
+            savepoint.rollback()
+        self.env.invalidate_all()
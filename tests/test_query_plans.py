@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import TransactionCase, tagged
+
+TRIGRAM_INDEXES = {
+    'product_product_ingredient_default_code_trgm_idx',
+    'product_product_ingredient_barcode_trgm_idx',
+    'product_template_ingredient_name_trgm_idx',
+}
+
+
+@tagged('-standard', 'query_plans', 'post_install', '-at_install')
+class TestQueryPlans(TransactionCase):
+    """Slow, builds a large synthetic catalog: run with --test-tags query_plans"""
+
+    def test_lookup_indexes(self):
+        results = self.env['recipe.benchmark']._check_query_plans()
+        used = set().union(*(result['used'] for result in results))
+        # Partial indexes
+        self.assertIn('product_product_is_ingredient_idx', used)
+        self.assertIn('product_template_available_in_pos_idx', used)
+        # Keyset pagination of the feeds
+        self.assertIn('restaurant_recipe_write_date_id_idx', used)
+        self.assertIn('recipe_ingredient_line_write_date_id_idx', used)
+        if self.env.registry.has_trigram:
+            self.assertTrue(used & TRIGRAM_INDEXES, "Ingredient autocomplete does not use a trigram index")
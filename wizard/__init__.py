@@ -1,3 +1,9 @@
 # -*- coding: utf-8 -*-
 from . import quick_ingredient
 from . import quick_product
+from . import usage_variance
+from . import menu_engineering
+from . import price_simulation
+from . import requirement_planner
+from . import bulk_repricing
+from . import recipe_bundle
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+import numpy as np
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from odoo.addons.pos_recipe_costing.models.recipe_perf_sample import instrument
+
+
+class BulkRepricing(models.TransientModel):
+    _name = 'recipe.bulk.repricing'
+    _description = 'Target Food Cost Repricing'
+
+    target_food_cost = fields.Float(string='Target Food Cost %', required=True, default=30.0)
+    rounding = fields.Selection([
+        ('none', 'No Rounding'),
+        ('step', 'Round Up to Step'),
+        ('95', 'End in .95'),
+        ('99', 'End in .99'),
+        ('whole', 'Whole Number'),
+    ], string='Rounding', required=True, default='95')
+    rounding_step = fields.Float(string='Step', default=0.5)
+    only_increase = fields.Boolean(
+        string='Only Increase Prices',
+        default=True,
+        help="Never lower the current selling price"
+    )
+
+    # Scope
+    categ_ids = fields.Many2many('product.category', string='Product Categories')
+    recipe_type = fields.Selection([
+        ('dish', 'Dish/Menu Item'),
+        ('component', 'Component/Sub-Recipe'),
+        ('drink', 'Beverage'),
+        ('dessert', 'Dessert'),
+    ], string='Recipe Type')
+    pos_categ_ids = fields.Many2many('pos.category', string='POS Categories')
+
+    currency_id = fields.Many2one('res.currency', default=lambda self: self.env.company.currency_id)
+    line_ids = fields.One2many('recipe.bulk.repricing.line', 'wizard_id', string='Preview', readonly=True)
+
+    def _get_scope_domain(self):
+        domain = [('product_id', '!=', False)]
+        if self.categ_ids:
+            domain.append(('product_id.categ_id', 'child_of', self.categ_ids.ids))
+        if self.recipe_type:
+            domain.append(('recipe_type', '=', self.recipe_type))
+        if self.pos_categ_ids:
+            domain.append(('product_id.pos_categ_ids', 'in', self.pos_categ_ids.ids))
+        return domain
+
+    def _round_prices(self, prices):
+        """Apply the rounding rule to a price vector"""
+        if self.rounding == 'step' and self.rounding_step > 0:
+            prices = np.ceil(prices / self.rounding_step) * self.rounding_step
+        elif self.rounding == '95':
+            prices = np.ceil(prices + 0.05) - 0.05
+        elif self.rounding == '99':
+            prices = np.ceil(prices + 0.01) - 0.01
+        elif self.rounding == 'whole':
+            prices = np.ceil(prices)
+        return np.round(prices, 2)
+
+    @instrument('bulk_repricing.preview')
+    def action_preview(self):
+        self.ensure_one()
+        if not 0 < self.target_food_cost < 100:
+            raise UserError(_('The target food cost must be between 0 and 100%.'))
+
+        recipes = self.env['restaurant.recipe'].search(self._get_scope_domain())
+        catalog = self.env['recipe.costing.catalog']._get_catalog()
+        recipe_ids = np.asarray(recipes.ids, dtype=np.int64)
+        index = np.searchsorted(catalog.recipe_ids, recipe_ids)
+        found = index < len(catalog.recipe_ids)
+        found[found] = catalog.recipe_ids[index[found]] == recipe_ids[found]
+        index, recipe_ids = index[found], recipe_ids[found]
+
+        # Whole scope in one vectorised pass
+        costs = catalog.costs_per_portion()[index]
+        current = catalog.selling_prices[index]
+        new_prices = self._round_prices(costs / (self.target_food_cost / 100.0))
+        if self.only_increase:
+            new_prices = np.maximum(new_prices, current)
+        changed = (costs > 0) & ~np.isclose(new_prices, current)
+
+        self.line_ids.unlink()
+        self.env['recipe.bulk.repricing.line'].create([{
+            'wizard_id': self.id,
+            'recipe_id': recipe_id,
+            'cost_per_portion': cost,
+            'current_price': price,
+            'new_price': new_price,
+        } for recipe_id, cost, price, new_price in zip(
+            recipe_ids[changed].tolist(), costs[changed].tolist(),
+            current[changed].tolist(), new_prices[changed].tolist(),
+        )])
+        return self._reopen()
+
+    @instrument('bulk_repricing.apply')
+    def action_apply(self):
+        self.ensure_one()
+        if not self.line_ids:
+            raise UserError(_('Preview the new prices before applying them.'))
+
+        # Templates carry the price: variants of one template asking for
+        # different prices cannot all be repriced, they are left out
+        list_prices = defaultdict(set)
+        for line in self.line_ids:
+            product = line.recipe_id.product_id
+            # lst_price includes the variant extra, list_price does not
+            list_prices[product.product_tmpl_id].add(self.currency_id.round(line.new_price - product.price_extra))
+        skipped = self.env['product.template'].concat(*(
+            template for template, prices in list_prices.items() if len(prices) > 1))
+
+        # One write per distinct price; the stored recipe costs are then
+        # recomputed together when the ORM flushes
+        templates_by_price = defaultdict(lambda: self.env['product.template'])
+        for template, prices in list_prices.items():
+            if template not in skipped:
+                templates_by_price[prices.pop()] |= template
+        for list_price, templates in templates_by_price.items():
+            templates.write({'list_price': list_price})
+        self.env.flush_all()
+
+        count = len(self.line_ids.filtered(lambda line: line.product_id.product_tmpl_id not in skipped))
+        self.line_ids.unlink()
+        message = _('%d menu items have been repriced.') % count
+        if skipped:
+            message += ' ' + _(
+                'Skipped %(products)s: their variants need different prices, adjust the variant extra prices instead.',
+                products=', '.join(skipped.mapped('display_name')))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Prices Updated'),
+                'message': message,
+                'type': 'warning' if skipped else 'success',
+                'sticky': bool(skipped),
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
+
+    def _reopen(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Bulk Repricing'),
+            'res_model': 'recipe.bulk.repricing',
+            'view_mode': 'form',
+            'res_id': self.id,
+            'target': 'new',
+        }
+
+
+class BulkRepricingLine(models.TransientModel):
+    _name = 'recipe.bulk.repricing.line'
+    _description = 'Target Food Cost Repricing Line'
+    _order = 'price_change desc'
+
+    wizard_id = fields.Many2one('recipe.bulk.repricing', required=True, ondelete='cascade')
+    recipe_id = fields.Many2one('restaurant.recipe', string='Recipe', readonly=True)
+    product_id = fields.Many2one(related='recipe_id.product_id', string='Menu Item')
+    currency_id = fields.Many2one(related='wizard_id.currency_id')
+    cost_per_portion = fields.Monetary(string='Cost per Portion', readonly=True)
+    current_price = fields.Monetary(string='Current Price', readonly=True)
+    new_price = fields.Monetary(string='New Price', readonly=True)
+    price_change = fields.Monetary(compute='_compute_food_costs', store=True, string='Change')
+    current_food_cost = fields.Float(compute='_compute_food_costs', store=True, string='Current Food Cost %')
+    new_food_cost = fields.Float(compute='_compute_food_costs', store=True, string='New Food Cost %')
+
+    @api.depends('cost_per_portion', 'current_price', 'new_price')
+    def _compute_food_costs(self):
+        for line in self:
+            line.price_change = line.new_price - line.current_price
+            line.current_food_cost = line.cost_per_portion / line.current_price * 100 if line.current_price else 0
+            line.new_food_cost = line.cost_per_portion / line.new_price * 100 if line.new_price else 0
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import fields, models, _
+from odoo.exceptions import UserError
+
+from odoo.addons.pos_recipe_costing.models.recipe_perf_sample import instrument
+
+MENU_CLASSES = [
+    ('star', 'Star'),
+    ('plowhorse', 'Plowhorse'),
+    ('puzzle', 'Puzzle'),
+    ('dog', 'Dog'),
+]
+
+
+class MenuEngineering(models.TransientModel):
+    _name = 'recipe.menu.engineering'
+    _description = 'Menu Engineering Analysis'
+
+    date_from = fields.Date(
+        string='From',
+        required=True,
+        default=lambda self: fields.Date.context_today(self) - timedelta(days=30)
+    )
+    date_to = fields.Date(string='To', required=True, default=fields.Date.context_today)
+    config_ids = fields.Many2many(
+        'pos.config',
+        string='Points of Sale',
+        domain="[('company_id', '=', current_company_id)]",
+        help="Leave empty to analyse all points of sale of the company"
+    )
+    popularity_factor = fields.Float(
+        string='Popularity Factor (%)',
+        default=70.0,
+        help="An item is popular when its sales mix reaches this percentage of an equal share (70% rule)"
+    )
+    currency_id = fields.Many2one('res.currency', default=lambda self: self.env.company.currency_id)
+    line_ids = fields.One2many('recipe.menu.engineering.line', 'wizard_id', string='Items', readonly=True)
+
+    margin_threshold = fields.Monetary(string='Average Contribution Margin', readonly=True)
+    popularity_threshold = fields.Float(string='Popularity Threshold (%)', readonly=True)
+
+    def _get_menu_engineering_rows(self):
+        """Aggregate sales, join the stored recipe margins and classify, in one query.
+
+        Only the sales and recipes of the current company are analysed. Each
+        recipe margin is converted from the recipe currency to the company
+        currency, at the company's recipe rate date.
+        """
+        date_to = self.date_to + timedelta(days=1)
+        company = self.env.company
+        rate_date = company._get_recipe_rate_date()
+        CostSource = self.env['recipe.cost.source']
+        currencies = company.currency_id
+        for currency, in self.env['restaurant.recipe']._read_group([('company_id', '=', company.id)], ['currency_id']):
+            currencies |= currency
+        rates = {
+            currency.id: CostSource._get_conversion_rate(currency, company.currency_id, company, rate_date)
+            for currency in currencies
+        }
+        self.env.cr.execute("""
+            WITH sales AS (
+                SELECT pol.product_id, SUM(pol.qty) AS qty
+                  FROM pos_order po
+                  JOIN pos_session ps ON ps.id = po.session_id
+                  JOIN pos_order_line pol ON pol.order_id = po.id
+                 WHERE po.company_id = %(company_id)s
+                   AND po.state IN ('paid', 'done', 'invoiced')
+                   AND po.date_order >= %(date_from)s
+                   AND po.date_order < %(date_to)s
+                   AND (%(all_configs)s OR ps.config_id = ANY(%(config_ids)s))
+              GROUP BY pol.product_id
+            ), items AS (
+                SELECT r.id AS recipe_id, s.product_id, s.qty, r.profit_margin * cr.rate AS profit_margin,
+                       s.qty * r.profit_margin * cr.rate AS total_margin
+                  FROM sales s
+                  JOIN restaurant_recipe r ON r.product_id = s.product_id
+                  JOIN unnest(%(currency_ids)s::int[], %(rates)s::float8[]) AS cr(currency_id, rate)
+                    ON cr.currency_id = COALESCE(r.currency_id, %(company_currency_id)s)
+                 WHERE r.active
+                   AND r.company_id = %(company_id)s
+                   AND s.qty > 0
+            ), thresholds AS (
+                SELECT SUM(qty) AS total_qty,
+                       SUM(total_margin) / NULLIF(SUM(qty), 0) AS margin_threshold,
+                       %(factor)s / COUNT(*) AS popularity_threshold
+                  FROM items
+            )
+            SELECT i.recipe_id, i.product_id, i.qty, i.profit_margin, i.total_margin,
+                   i.qty / t.total_qty AS popularity,
+                   t.margin_threshold, t.popularity_threshold,
+                   CASE
+                       WHEN i.profit_margin >= t.margin_threshold AND i.qty / t.total_qty >= t.popularity_threshold THEN 'star'
+                       WHEN i.profit_margin >= t.margin_threshold THEN 'puzzle'
+                       WHEN i.qty / t.total_qty >= t.popularity_threshold THEN 'plowhorse'
+                       ELSE 'dog'
+                   END AS classification
+              FROM items i
+        CROSS JOIN thresholds t
+        """, {
+            'company_id': company.id,
+            'company_currency_id': company.currency_id.id,
+            'currency_ids': list(rates),
+            'rates': list(rates.values()),
+            'date_from': self.date_from,
+            'date_to': date_to,
+            'all_configs': not self.config_ids,
+            'config_ids': self.config_ids.ids,
+            'factor': self.popularity_factor / 100.0,
+        })
+        return self.env.cr.dictfetchall()
+
+    @instrument('menu_engineering.analyse')
+    def action_analyse(self):
+        self.ensure_one()
+        if self.date_from > self.date_to:
+            raise UserError(_('The start date must be before the end date.'))
+
+        self.env.flush_all()
+        rows = self._get_menu_engineering_rows()
+
+        self.line_ids.unlink()
+        self.env['recipe.menu.engineering.line'].create([{
+            'wizard_id': self.id,
+            'recipe_id': row['recipe_id'],
+            'product_id': row['product_id'],
+            'qty_sold': row['qty'],
+            'profit_margin': row['profit_margin'],
+            'total_margin': row['total_margin'],
+            'popularity': row['popularity'] * 100,
+            'classification': row['classification'],
+        } for row in rows])
+        self.write({
+            'margin_threshold': rows[0]['margin_threshold'] if rows else 0,
+            'popularity_threshold': rows[0]['popularity_threshold'] * 100 if rows else 0,
+        })
+
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Menu Engineering'),
+            'res_model': 'recipe.menu.engineering',
+            'view_mode': 'form',
+            'res_id': self.id,
+            'target': 'current',
+        }
+
+
+class MenuEngineeringLine(models.TransientModel):
+    _name = 'recipe.menu.engineering.line'
+    _description = 'Menu Engineering Item'
+    _order = 'total_margin desc'
+
+    wizard_id = fields.Many2one('recipe.menu.engineering', required=True, ondelete='cascade')
+    recipe_id = fields.Many2one('restaurant.recipe', string='Recipe', readonly=True)
+    product_id = fields.Many2one('product.product', string='Menu Item', readonly=True)
+    recipe_type = fields.Selection(related='recipe_id.recipe_type')
+    currency_id = fields.Many2one(related='wizard_id.currency_id')
+
+    qty_sold = fields.Float(string='Sold', readonly=True)
+    popularity = fields.Float(string='Sales Mix %', readonly=True)
+    profit_margin = fields.Monetary(string='Contribution Margin', readonly=True)
+    total_margin = fields.Monetary(string='Total Margin', readonly=True)
+    classification = fields.Selection(MENU_CLASSES, string='Class', readonly=True)
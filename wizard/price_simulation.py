@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from odoo.addons.pos_recipe_costing.models.recipe_perf_sample import instrument
+
+
+class PriceSimulation(models.TransientModel):
+    _name = 'recipe.price.simulation'
+    _description = 'Ingredient Price Simulation'
+
+    change_ids = fields.One2many('recipe.price.simulation.change', 'wizard_id', string='Price Changes')
+    result_ids = fields.One2many('recipe.price.simulation.result', 'wizard_id', string='Impact', readonly=True)
+    currency_id = fields.Many2one('res.currency', default=lambda self: self.env.company.currency_id)
+    affected_count = fields.Integer(compute='_compute_summary', string='Affected Recipes')
+    total_cost_delta = fields.Monetary(compute='_compute_summary', string='Total Cost Change per Portion')
+
+    @api.depends('result_ids.cost_delta')
+    def _compute_summary(self):
+        for wizard in self:
+            wizard.affected_count = len(wizard.result_ids)
+            wizard.total_cost_delta = sum(wizard.result_ids.mapped('cost_delta'))
+
+    @instrument('price_simulation.simulate')
+    def action_simulate(self):
+        self.ensure_one()
+        if not self.change_ids:
+            raise UserError(_('Add at least one ingredient price change.'))
+
+        changes = {
+            change.product_id.id: (change.change_type, change.value)
+            for change in self.change_ids
+        }
+        results = self.env['restaurant.recipe']._simulate_price_changes(changes, self.currency_id)
+
+        self.result_ids.unlink()
+        self.env['recipe.price.simulation.result'].create([
+            dict(result, wizard_id=self.id) for result in results
+        ])
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Price Simulation'),
+            'res_model': 'recipe.price.simulation',
+            'view_mode': 'form',
+            'res_id': self.id,
+            'target': 'current',
+        }
+
+
+class PriceSimulationChange(models.TransientModel):
+    _name = 'recipe.price.simulation.change'
+    _description = 'Simulated Ingredient Price Change'
+
+    wizard_id = fields.Many2one('recipe.price.simulation', required=True, ondelete='cascade')
+    product_id = fields.Many2one(
+        'product.product',
+        string='Ingredient',
+        required=True,
+        domain="[('is_ingredient', '=', True)]"
+    )
+    current_price = fields.Float(related='product_id.standard_price', string='Current Cost')
+    change_type = fields.Selection([
+        ('percentage', 'Change (%)'),
+        ('amount', 'Change (Amount)'),
+        ('price', 'New Price'),
+    ], string='Change Type', required=True, default='percentage')
+    value = fields.Float(string='Value', required=True)
+
+
+class PriceSimulationResult(models.TransientModel):
+    _name = 'recipe.price.simulation.result'
+    _description = 'Simulated Recipe Cost'
+    _order = 'cost_delta desc'
+
+    wizard_id = fields.Many2one('recipe.price.simulation', required=True, ondelete='cascade')
+    recipe_id = fields.Many2one('restaurant.recipe', string='Recipe', readonly=True)
+    currency_id = fields.Many2one(related='wizard_id.currency_id')
+    selling_price = fields.Monetary(string='Selling Price', readonly=True)
+    current_cost = fields.Monetary(string='Current Cost/Portion', readonly=True)
+    simulated_cost = fields.Monetary(string='Simulated Cost/Portion', readonly=True)
+    cost_delta = fields.Monetary(compute='_compute_deltas', store=True, string='Cost Change')
+    current_food_cost = fields.Float(string='Current Food Cost %', readonly=True)
+    simulated_food_cost = fields.Float(string='Simulated Food Cost %', readonly=True)
+    food_cost_delta = fields.Float(compute='_compute_deltas', store=True, string='Food Cost % Change')
+
+    @api.depends('current_cost', 'simulated_cost', 'current_food_cost', 'simulated_food_cost')
+    def _compute_deltas(self):
+        for result in self:
+            result.cost_delta = result.simulated_cost - result.current_cost
+            result.food_cost_delta = result.simulated_food_cost - result.current_food_cost
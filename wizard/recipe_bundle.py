@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import base64
+
+from odoo import fields, models, _
+
+
+class RecipeBundleExport(models.TransientModel):
+    _name = 'recipe.bundle.export'
+    _description = 'Export Recipe Bundle'
+
+    base_bundle = fields.Char(
+        string='Base Bundle',
+        help="Id of the last bundle the receiving database applied, as reported by its import. "
+             "Leave empty to export every recipe."
+    )
+    state = fields.Selection([('choose', 'Choose'), ('done', 'Done')], default='choose')
+    data = fields.Binary(string='Bundle', readonly=True, attachment=False)
+    filename = fields.Char(string='File Name', readonly=True)
+    summary = fields.Text(string='Summary', readonly=True)
+
+    def action_export(self):
+        self.ensure_one()
+        data, stats = self.env['recipe.sync.bundle']._export_bundle(base=self.base_bundle)
+        summary = _('Bundle %(bundle)s: %(changed)s of %(recipes)s recipes changed, %(removed)s removed, '
+                    '%(size)s bytes.', **stats)
+        if stats['skipped']:
+            summary += '\n' + _('Skipped, menu item or ingredient without reference or barcode: %s',
+                                ', '.join(stats['skipped']))
+        self.write({
+            'state': 'done',
+            'data': base64.b64encode(data),
+            'filename': f'recipes-{fields.Date.context_today(self)}.json.gz',
+            'summary': summary,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+
+class RecipeBundleImport(models.TransientModel):
+    _name = 'recipe.bundle.import'
+    _description = 'Import Recipe Bundle'
+
+    data = fields.Binary(string='Bundle', required=True, attachment=False)
+    filename = fields.Char(string='File Name')
+    state = fields.Selection([('choose', 'Choose'), ('done', 'Done')], default='choose')
+    summary = fields.Text(string='Summary', readonly=True)
+
+    def action_import(self):
+        self.ensure_one()
+        stats = self.env['recipe.sync.bundle']._import_bundle(base64.b64decode(self.data))
+        summary = _('Bundle %(bundle)s: %(created)s recipes created, %(updated)s updated, '
+                    '%(unchanged)s unchanged, %(archived)s archived.', **stats)
+        if stats['errors']:
+            summary += '\n' + _('Not applied, the next bundle must be exported from the same base:')
+            summary += '\n' + '\n'.join(stats['errors'])
+        else:
+            summary += '\n' + _('Base of the next bundle: %s', stats['bundle'])
+        self.write({'state': 'done', 'summary': summary})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
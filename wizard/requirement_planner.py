@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from odoo.addons.pos_recipe_costing.models.recipe_perf_sample import instrument
+
+
+class RequirementPlanner(models.TransientModel):
+    _name = 'recipe.requirement.planner'
+    _description = 'Ingredient Requirements Planner'
+
+    forecast_type = fields.Selection([
+        ('dishes', 'Per-Dish Forecast'),
+        ('covers', 'Expected Covers'),
+    ], string='Forecast', required=True, default='dishes')
+    date_from = fields.Date(string='From', required=True, default=fields.Date.context_today)
+    date_to = fields.Date(
+        string='To',
+        required=True,
+        default=lambda self: fields.Date.context_today(self) + timedelta(days=6)
+    )
+
+    # Per-dish forecast
+    forecast_ids = fields.One2many('recipe.requirement.forecast', 'planner_id', string='Dish Forecast')
+
+    # Covers forecast, spread over the dishes with the historical sales mix
+    covers_per_day = fields.Float(string='Covers per Day')
+    history_days = fields.Integer(string='Sales History (days)', default=28)
+    config_ids = fields.Many2many(
+        'pos.config',
+        string='Points of Sale',
+        domain="[('company_id', '=', current_company_id)]",
+        help="Points of sale used for the historical sales mix, leave empty for all those of the company"
+    )
+
+    deduct_on_hand = fields.Boolean(string='Deduct On Hand', default=True)
+    line_ids = fields.One2many('recipe.requirement.line', 'planner_id', string='Requirements', readonly=True)
+
+    def _get_dish_quantities(self):
+        """Return {menu item id: forecast quantity} over the horizon"""
+        if self.forecast_type == 'dishes':
+            return {
+                product.id: qty
+                for product, qty in self.env['recipe.requirement.forecast']._read_group(
+                    [('planner_id', '=', self.id)], ['product_id'], ['quantity:sum'],
+                )
+            }
+
+        days = (self.date_to - self.date_from).days + 1
+        covers = self.covers_per_day * days
+        self.env.flush_all()
+        self.env.cr.execute("""
+            WITH orders AS (
+                SELECT po.id, GREATEST(po.customer_count, 1) AS covers
+                  FROM pos_order po
+                  JOIN pos_session ps ON ps.id = po.session_id
+                 WHERE po.company_id = %(company_id)s
+                   AND po.state IN ('paid', 'done', 'invoiced')
+                   AND po.date_order >= %(date_from)s
+                   AND (%(all_configs)s OR ps.config_id = ANY(%(config_ids)s))
+            )
+            SELECT pol.product_id,
+                   SUM(pol.qty) / NULLIF((SELECT SUM(covers) FROM orders), 0)
+              FROM pos_order_line pol
+              JOIN orders o ON o.id = pol.order_id
+          GROUP BY pol.product_id
+        """, {
+            'company_id': self.env.company.id,
+            'date_from': fields.Datetime.now() - timedelta(days=self.history_days),
+            'all_configs': not self.config_ids,
+            'config_ids': self.config_ids.ids,
+        })
+        return {product_id: (per_cover or 0.0) * covers for product_id, per_cover in self.env.cr.fetchall()}
+
+    @staticmethod
+    def _align(ids, quantities):
+        """Vector of ``quantities`` ({id: qty}) aligned on the sorted ``ids`` array"""
+        vector = np.zeros(len(ids))
+        if not len(ids) or not quantities:
+            return vector
+        keys = np.fromiter(quantities.keys(), dtype=np.int64, count=len(quantities))
+        values = np.fromiter(quantities.values(), dtype=np.float64, count=len(quantities))
+        index = np.minimum(np.searchsorted(ids, keys), len(ids) - 1)
+        found = ids[index] == keys
+        np.add.at(vector, index[found], values[found])
+        return vector
+
+    def _compute_prep_quantities(self, dishes):
+        """Quantities of sub-recipes to prepare, walking the recipe levels"""
+        Recipe = self.env['restaurant.recipe']
+        item_ids, component_ids, rows, cols, qty = Recipe._get_direct_line_matrix()
+        prep = defaultdict(float)
+        if not len(item_ids):
+            return prep
+        is_sub_recipe = np.isin(component_ids, item_ids)
+        level = self._align(item_ids, dishes)
+        # Bounded depth guards against recipe cycles
+        for _depth in range(10):
+            needed = np.bincount(cols, weights=qty * level[rows], minlength=len(component_ids))
+            mask = is_sub_recipe & (needed > 0)
+            if not mask.any():
+                break
+            sub_needed = dict(zip(component_ids[mask].tolist(), needed[mask].tolist()))
+            for product_id, value in sub_needed.items():
+                prep[product_id] += value
+            level = self._align(item_ids, sub_needed)
+        return prep
+
+    @instrument('requirement_planner.compute')
+    def action_compute(self):
+        self.ensure_one()
+        if self.date_from > self.date_to:
+            raise UserError(_('The start date must be before the end date.'))
+
+        dishes = self._get_dish_quantities()
+        if not dishes:
+            raise UserError(_('There is nothing to plan: add a dish forecast or expected covers with sales history.'))
+
+        # Purchase requirements: dish vector x flattened explosion, one pass
+        item_ids, ingredient_ids, rows, cols, qty = self.env['restaurant.recipe']._get_explosion_matrix()
+        dish_vector = self._align(item_ids, dishes)
+        required = np.bincount(cols, weights=qty * dish_vector[rows], minlength=len(ingredient_ids))
+        purchase = {
+            product_id: value
+            for product_id, value in zip(ingredient_ids.tolist(), required.tolist())
+            if value > 0
+        }
+        prep = self._compute_prep_quantities(dishes)
+
+        on_hand = {}
+        if self.deduct_on_hand:
+            on_hand = {
+                product.id: quantity
+                for product, quantity in self.env['stock.quant'].sudo()._read_group(
+                    [('product_id', 'in', list(purchase.keys() | prep.keys())),
+                     ('location_id.usage', '=', 'internal'),
+                     ('company_id', '=', self.env.company.id)],
+                    ['product_id'],
+                    ['quantity:sum'],
+                )
+            }
+
+        self.line_ids.unlink()
+        self.env['recipe.requirement.line'].create([{
+            'planner_id': self.id,
+            'line_type': line_type,
+            'product_id': product_id,
+            'required_qty': value,
+            'on_hand_qty': on_hand.get(product_id, 0.0),
+        } for line_type, quantities in (('purchase', purchase), ('prep', prep))
+            for product_id, value in quantities.items()])
+
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Ingredient Requirements'),
+            'res_model': 'recipe.requirement.line',
+            'view_mode': 'list',
+            'domain': [('planner_id', '=', self.id)],
+            'context': {'group_by': ['line_type', 'ingredient_category']},
+            'target': 'current',
+        }
+
+
+class RequirementForecast(models.TransientModel):
+    _name = 'recipe.requirement.forecast'
+    _description = 'Dish Forecast'
+
+    planner_id = fields.Many2one('recipe.requirement.planner', required=True, ondelete='cascade')
+    date = fields.Date(string='Date')
+    product_id = fields.Many2one(
+        'product.product',
+        string='Menu Item',
+        required=True,
+        domain="[('has_recipe', '=', True)]"
+    )
+    quantity = fields.Float(string='Quantity', required=True, default=1.0)
+
+
+class RequirementLine(models.TransientModel):
+    _name = 'recipe.requirement.line'
+    _description = 'Ingredient Requirement'
+    _order = 'line_type, ingredient_category, product_id'
+
+    planner_id = fields.Many2one('recipe.requirement.planner', required=True, ondelete='cascade')
+    line_type = fields.Selection([
+        ('purchase', 'Purchase'),
+        ('prep', 'Prep'),
+    ], string='Type', readonly=True)
+    product_id = fields.Many2one('product.product', string='Product', readonly=True)
+    ingredient_category = fields.Selection(related='product_id.ingredient_category', store=True)
+    uom_id = fields.Many2one(related='product_id.uom_id', string='UoM')
+    required_qty = fields.Float(string='Required', digits='Product Unit of Measure', readonly=True)
+    on_hand_qty = fields.Float(string='On Hand', digits='Product Unit of Measure', readonly=True)
+    net_qty = fields.Float(string='To Buy / Prep', compute='_compute_net_qty', store=True,
+                           digits='Product Unit of Measure')
+    unit_cost = fields.Float(related='product_id.standard_price', string='Unit Cost')
+    net_value = fields.Float(string='Value', compute='_compute_net_qty', store=True)
+
+    @api.depends('required_qty', 'on_hand_qty', 'unit_cost')
+    def _compute_net_qty(self):
+        for line in self:
+            line.net_qty = max(line.required_qty - line.on_hand_qty, 0.0)
+            line.net_value = line.net_qty * line.unit_cost
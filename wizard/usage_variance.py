@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from odoo.addons.pos_recipe_costing.models.recipe_perf_sample import instrument
+
+
+class UsageVariance(models.TransientModel):
+    _name = 'recipe.usage.variance'
+    _description = 'Theoretical vs Actual Usage'
+
+    stocktake_start_id = fields.Many2one(
+        'ingredient.stocktake',
+        string='Opening Stocktake',
+        required=True,
+        domain="[('state', '=', 'done')]"
+    )
+    stocktake_end_id = fields.Many2one(
+        'ingredient.stocktake',
+        string='Closing Stocktake',
+        required=True,
+        domain="[('state', '=', 'done')]"
+    )
+    company_id = fields.Many2one(related='stocktake_end_id.company_id')
+    currency_id = fields.Many2one(related='stocktake_end_id.currency_id')
+    line_ids = fields.One2many('recipe.usage.variance.line', 'wizard_id', string='Lines', readonly=True)
+
+    total_theoretical_value = fields.Monetary(compute='_compute_totals', string='Theoretical Value')
+    total_actual_value = fields.Monetary(compute='_compute_totals', string='Actual Value')
+    total_variance_value = fields.Monetary(compute='_compute_totals', string='Variance Value')
+
+    @api.depends('line_ids.theoretical_value', 'line_ids.actual_value', 'line_ids.variance_value')
+    def _compute_totals(self):
+        for wizard in self:
+            lines = wizard.line_ids
+            wizard.total_theoretical_value = sum(lines.mapped('theoretical_value'))
+            wizard.total_actual_value = sum(lines.mapped('actual_value'))
+            wizard.total_variance_value = sum(lines.mapped('variance_value'))
+
+    def _get_theoretical_usage(self, date_from, date_to):
+        """Ingredient usage implied by POS sales, in one aggregate query.
+
+        Sold quantities are exploded through the flattened recipe lines, which
+        already carry the UoM conversion and the sub-recipes.
+        """
+        self.env.cr.execute("""
+            SELECT e.product_id, SUM(pol.qty * e.quantity)
+              FROM pos_order_line pol
+              JOIN pos_order po ON po.id = pol.order_id
+              JOIN restaurant_recipe r ON r.product_id = pol.product_id
+              JOIN recipe_explosion_line e ON e.recipe_id = r.id
+             WHERE po.state IN ('paid', 'done', 'invoiced')
+               AND po.company_id = %s
+               AND po.date_order > %s
+               AND po.date_order <= %s
+          GROUP BY e.product_id
+        """, [self.company_id.id, date_from, date_to])
+        return dict(self.env.cr.fetchall())
+
+    def _get_received_quantities(self, product_ids, date_from, date_to):
+        """Quantities received from suppliers into internal locations"""
+        self.env.cr.execute("""
+            SELECT sm.product_id, SUM(sm.product_qty)
+              FROM stock_move sm
+              JOIN stock_location src ON src.id = sm.location_id
+              JOIN stock_location dest ON dest.id = sm.location_dest_id
+             WHERE sm.state = 'done'
+               AND sm.company_id = %s
+               AND sm.product_id = ANY(%s)
+               AND src.usage = 'supplier'
+               AND dest.usage = 'internal'
+               AND sm.date > %s
+               AND sm.date <= %s
+          GROUP BY sm.product_id
+        """, [self.company_id.id, list(product_ids), date_from, date_to])
+        return dict(self.env.cr.fetchall())
+
+    @instrument('usage_variance.compute')
+    def action_compute(self):
+        self.ensure_one()
+        start, end = self.stocktake_start_id, self.stocktake_end_id
+        date_from = start._get_count_datetime()
+        date_to = end._get_count_datetime()
+        if date_from >= date_to:
+            raise UserError(_('The opening stocktake must be before the closing stocktake.'))
+        if start.company_id != end.company_id:
+            raise UserError(_('Both stocktakes must belong to the same company.'))
+
+        opening = {line.product_id.id: line.counted_qty for line in start.line_ids}
+        closing = {line.product_id.id: line.counted_qty for line in end.line_ids}
+        # Actual usage is only known for ingredients counted both times
+        product_ids = opening.keys() & closing.keys()
+
+        self.env.flush_all()
+        theoretical = self._get_theoretical_usage(date_from, date_to)
+        received = self._get_received_quantities(product_ids, date_from, date_to)
+
+        self.line_ids.unlink()
+        self.env['recipe.usage.variance.line'].create([{
+            'wizard_id': self.id,
+            'product_id': product_id,
+            'opening_qty': opening[product_id],
+            'received_qty': received.get(product_id, 0.0),
+            'closing_qty': closing[product_id],
+            'theoretical_qty': theoretical.get(product_id, 0.0),
+        } for product_id in product_ids])
+
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Usage Variance'),
+            'res_model': 'recipe.usage.variance',
+            'view_mode': 'form',
+            'res_id': self.id,
+            'target': 'current',
+        }
+
+
+class UsageVarianceLine(models.TransientModel):
+    _name = 'recipe.usage.variance.line'
+    _description = 'Theoretical vs Actual Usage Line'
+    _order = 'variance_value desc'
+
+    wizard_id = fields.Many2one('recipe.usage.variance', required=True, ondelete='cascade')
+    product_id = fields.Many2one('product.product', string='Ingredient', readonly=True)
+    ingredient_category = fields.Selection(related='product_id.ingredient_category')
+    uom_id = fields.Many2one(related='product_id.uom_id', string='UoM')
+    currency_id = fields.Many2one(related='wizard_id.currency_id')
+
+    opening_qty = fields.Float(string='Opening Count', digits='Product Unit of Measure')
+    received_qty = fields.Float(string='Received', digits='Product Unit of Measure')
+    closing_qty = fields.Float(string='Closing Count', digits='Product Unit of Measure')
+    actual_qty = fields.Float(string='Actual Usage', compute='_compute_variance', store=True,
+                              digits='Product Unit of Measure')
+    theoretical_qty = fields.Float(string='Theoretical Usage', digits='Product Unit of Measure')
+    variance_qty = fields.Float(string='Variance', compute='_compute_variance', store=True,
+                                digits='Product Unit of Measure',
+                                help="Actual minus theoretical usage, positive means unexplained loss")
+    variance_percentage = fields.Float(string='Variance %', compute='_compute_variance', store=True)
+
+    unit_cost = fields.Float(related='product_id.standard_price', string='Unit Cost')
+    theoretical_value = fields.Monetary(compute='_compute_variance', store=True, string='Theoretical Value')
+    actual_value = fields.Monetary(compute='_compute_variance', store=True, string='Actual Value')
+    variance_value = fields.Monetary(compute='_compute_variance', store=True, string='Variance Value')
+
+    @api.depends('opening_qty', 'received_qty', 'closing_qty', 'theoretical_qty', 'unit_cost')
+    def _compute_variance(self):
+        for line in self:
+            line.actual_qty = line.opening_qty + line.received_qty - line.closing_qty
+            line.variance_qty = line.actual_qty - line.theoretical_qty
+            if line.theoretical_qty:
+                line.variance_percentage = line.variance_qty / line.theoretical_qty * 100
+            else:
+                line.variance_percentage = 0
+            line.theoretical_value = line.theoretical_qty * line.unit_cost
+            line.actual_value = line.actual_qty * line.unit_cost
+            line.variance_value = line.variance_qty * line.unit_cost